@@ -1,5 +1,13 @@
-from tetris_engine import TetrisGame, MoveScanner
+from tetris_engine import TetrisGame, MoveScanner, PIECE_TABLE, can_spawn
+from settings import MOVEMENT_MODEL
+from profiler import NULL_PROFILER
 import random
+import heapq
+
+try: 
+    import numpy as np
+except ImportError: # numpy is optional (PyPy usually doesn't have it), batch evaluation just turns off
+    np = None
 
 # Mutation stats
 BASE_MUTATION_RATE = 0.1
@@ -9,8 +17,68 @@ BASE_MUTATION_STEP = 2.0
 HEIGHT_PENALTY_TOGGLE = True
 HEIGHT_PENALTY_EXPONENT = 2.5
 
+# Lookahead (beam search over the preview pieces, 0 = only look at the current and held piece)
+LOOKAHEAD_DEPTH = 0 # extra pieces to look ahead (capped by PIECE_PREVIEW_AMOUNT)
+BEAM_WIDTH = 5 # boards kept after every piece
+
+# Batch evaluation (scores every candidate in one go with numpy, needs numpy installed)
+BATCH_EVALUATION_TOGGLE = False
+
+FEATURE_KEYS = ["height", "holes", "bumpiness", "wells", "lines"]
+
+# feature vectors: the FEATURE_KEYS stats in order, then the height penalty (unweighted, always subtracted)
+# so scoring a board under another genome is just another dot product, no board scanning
+HEIGHT_PENALTY_INDEX = len(FEATURE_KEYS)
+
+def compile_weights(weights): 
+    # genome dict -> weight tuple lined up with the feature vector (missing weights count as 0)
+    return tuple(weights.get(key, 0) for key in FEATURE_KEYS)
+
 class BoardEvaluator: 
     def get_score(self, board, weights): 
+        return self.score_features(self.extract_features(board), compile_weights(weights))
+    
+    
+    def get_board_score(self, board, weights): 
+        # kept for older callers, get_score reads bitboard Boards directly now
+        return self.get_score(board, weights)
+    
+    
+    def get_placement_score(self, board, move, weights): 
+        # score of the board after the move, using the Board's incremental heights/holes (no board copy)
+        return self.score_features(self.placement_features(board, move), compile_weights(weights))
+    
+    
+    def score_features(self, features, compiled_weights): 
+        # dot product in the same order the weighted sum has always been added up in, so scores stay bit for bit the same
+        agg_height, holes, bumpiness, wells, lines, height_penalty = features
+        height_weight, holes_weight, bumpiness_weight, wells_weight, lines_weight = compiled_weights
+        return 0 + agg_height * height_weight + holes * holes_weight + bumpiness * bumpiness_weight + wells * wells_weight + lines * lines_weight - height_penalty
+    
+    
+    def score_matrix(self, features_list, compiled_weights_list, as_array=False): 
+        # scores[i][g] = score of candidate i (feature vector) under genome g (compiled weights), in one call
+        # numpy adds it up feature by feature (not a matrix product) so every entry matches score_features exactly
+        # as_array=True hands back the numpy array itself (only when numpy is installed)
+        if np is None or not len(features_list) or not len(compiled_weights_list): 
+            return [[self.score_features(features, weights) for weights in compiled_weights_list] for features in features_list]
+        
+        features = np.asarray(features_list, dtype=float)
+        weights = np.asarray(compiled_weights_list, dtype=float)
+        scores = np.zeros((len(features), len(weights)))
+        for k in range(len(FEATURE_KEYS)): 
+            scores += features[:, k, None] * weights[None, :, k]
+        scores -= features[:, HEIGHT_PENALTY_INDEX, None]
+        return scores if as_array else scores.tolist()
+    
+    
+    def extract_features(self, board): 
+        # feature vector of a list[list[int]] grid, a ListBoard or a bitboard Board
+        if hasattr(board, 'rows'): 
+            return self._bitboard_features(board)
+        if hasattr(board, 'board'): 
+            board = board.board
+        
         width = len(board[0])
         heights = []
         for x in range(width):
@@ -18,32 +86,62 @@ class BoardEvaluator:
             heights.append(h)
             
         # get raw stats
-        agg_height = self.calculate_aggregate_height(board, heights)
         holes = self.calculate_holes(board, heights)
+        lines = self.count_completed_lines(board)
+        
+        return self._features(board, heights, holes, lines)
+    
+    
+    def _bitboard_features(self, board): 
+        board_height = board.height
+        full_row = board.full_row
+        heights = [0] * board.width
+        holes = 0
+        lines = 0
+        
+        # walk rows top down, seen = every column whose top block has been found already
+        seen = 0
+        for y, row in enumerate(board.rows): 
+            new_cols = row & ~seen
+            while new_cols: 
+                low_bit = new_cols & -new_cols
+                heights[low_bit.bit_length() - 1] = board_height - y
+                new_cols ^= low_bit
+            seen |= row
+            
+            # empty cells under a column's top block = holes
+            holes += bin(seen & ~row).count("1")
+            if row == full_row: 
+                lines += 1
+        
+        return self._features(board, heights, holes, lines)
+    
+    
+    def placement_features(self, board, move): 
+        # feature vector of the board after the move
+        if not hasattr(board, 'placement_stats'): 
+            x, y, r, pk, T_spin = move
+            board.lock_piece(x, y, r, pk)
+            features = self.extract_features(board)
+            board.unlock_piece(x, y, r, pk)
+            return features
+        
+        x, y, r, pk, T_spin = move
+        heights, holes, lines = board.placement_stats(x, y, r, pk)
+        return self._features(board, heights, holes, lines)
+    
+    
+    def _features(self, board, heights, holes, lines): 
+        agg_height = self.calculate_aggregate_height(board, heights)
         bumpiness = self.calculate_bumpiness(heights)
         wells = self.calculate_wells(heights)
-        lines = self.count_completed_lines(board)
         
         # extra penalties
         height_penalty = 0
         if HEIGHT_PENALTY_TOGGLE: 
             height_penalty = self._calculate_height_penalty(heights)
-            
-        
-        # move score
-        score = 0
-        
-        # multiply raw stats by weights and sum it
-        score += agg_height * weights.get("height", 0)
-        score += holes * weights.get("holes", 0)
-        score += bumpiness * weights.get("bumpiness", 0)
-        score += wells * weights.get("wells", 0)
-        score += lines * weights.get("lines", 0)
-        
-        # score penalties
-        score -= height_penalty
         
-        return score
+        return (agg_height, holes, bumpiness, wells, lines, height_penalty)
     
     
     def calculate_aggregate_height(self, board, heights): 
@@ -130,22 +228,207 @@ class BoardEvaluator:
 
 
 
+class BatchBoardEvaluator: 
+    # numpy version of BoardEvaluator, stacks every candidate board into one (N, height, width) array
+    # and computes all the features for the whole stack at once
+    # BoardEvaluator is still the reference, this has to give the exact same scores
+    def __init__(self): 
+        self.penalty_tables = {}
+        
+    def get_scores(self, board, moves, weights): 
+        return self.score_stack(self.build_stack(board, moves), weights)
+    
+    def get_scores_multi(self, boards, move_lists, weights_list): 
+        # scores the candidates of many boards (each with its own weights) as one stack
+        # returns one score array per board
+        counts = [len(moves) for moves in move_lists]
+        stack = self.build_multi_stack(boards, move_lists)
+        
+        # every candidate gets its own board's weights
+        weights = {key: np.repeat([weights.get(key, 0) for weights in weights_list], counts) for key in FEATURE_KEYS}
+        scores = self.score_stack(stack, weights)
+        return np.split(scores, np.cumsum(counts)[:-1])
+    
+    def score_stack(self, stack, weights): 
+        # weights values can be floats (same genome for everything) or one per board in the stack
+        board_height = stack.shape[1]
+        width = stack.shape[2]
+        
+        # covered = cells at or under each column's top block
+        covered = np.maximum.accumulate(stack, axis=1)
+        heights = covered.sum(axis=1) # (N, width)
+        
+        agg_height = heights.sum(axis=1)
+        holes = (covered & ~stack).sum(axis=(1, 2))
+        bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+        wells = self.calculate_wells(heights)
+        lines = stack.all(axis=2).sum(axis=1)
+        
+        # penalties come from a table built with python floats (numpy's ** rounds a little differently)
+        # and get added column by column to keep BoardEvaluator's float rounding (np.sum adds pairwise)
+        height_penalty = 0
+        if HEIGHT_PENALTY_TOGGLE: 
+            penalty_table = self._get_penalty_table(board_height)
+            height_penalty = np.zeros(len(stack))
+            for x in range(width): 
+                height_penalty = height_penalty + penalty_table[heights[:, x]]
+        
+        score = np.zeros(len(stack))
+        score += agg_height * weights.get("height", 0)
+        score += holes * weights.get("holes", 0)
+        score += bumpiness * weights.get("bumpiness", 0)
+        score += wells * weights.get("wells", 0)
+        score += lines * weights.get("lines", 0)
+        
+        score -= height_penalty
+        
+        return score
+    
+    def _get_penalty_table(self, board_height): 
+        # penalty_table[h] = BoardEvaluator's height penalty for one column of height h
+        if board_height not in self.penalty_tables: 
+            reference = BoardEvaluator()
+            self.penalty_tables[board_height] = np.array([float(reference._calculate_height_penalty([h])) for h in range(board_height + 1)])
+        return self.penalty_tables[board_height]
+    
+    def get_best_index(self, board, moves, weights): 
+        # index of the best move (first one wins ties, same as the one at a time loop)
+        return int(np.argmax(self.get_scores(board, moves, weights)))
+    
+    def build_stack(self, board, moves): 
+        if hasattr(board, 'rows'): 
+            base = (np.array(board.rows)[:, None] >> np.arange(board.width)) & 1
+        else: 
+            base = np.array(board.board)
+        stack = np.repeat(base.astype(bool)[None], len(moves), axis=0)
+        self._place_pieces(stack, moves)
+        return stack
+    
+    def build_multi_stack(self, boards, move_lists): 
+        # all the boards' row masks go into one (boards, height) array, then get expanded to cells
+        rows = np.array([board.rows for board in boards])
+        base = ((rows[:, :, None] >> np.arange(boards[0].width)) & 1).astype(bool)
+        
+        owners = np.repeat(np.arange(len(boards)), [len(moves) for moves in move_lists])
+        stack = base[owners]
+        self._place_pieces(stack, [move for moves in move_lists for move in moves])
+        return stack
+    
+    def _place_pieces(self, stack, moves): 
+        # stack[i] gets moves[i]'s piece cells filled in
+        move_idx = []
+        cell_ys = []
+        cell_xs = []
+        for i, (x, y, r, pk, T_spin) in enumerate(moves): 
+            for c, row in PIECE_TABLE[pk][r % 4]['cells']: 
+                move_idx.append(i)
+                cell_ys.append(y + row)
+                cell_xs.append(x + c)
+        stack[move_idx, cell_ys, cell_xs] = True
+    
+    def calculate_wells(self, heights): 
+        # same rules as BoardEvaluator.calculate_wells (walls count as height 20)
+        padded = np.pad(heights, ((0, 0), (1, 1)), constant_values=20)
+        well_depth = np.minimum(padded[:, :-2], padded[:, 2:]) - heights
+        is_well = well_depth >= 4
+        
+        side_well_count = is_well[:, 0].astype(int) + is_well[:, -1]
+        other_well_count = is_well[:, 1:-1].sum(axis=1)
+        total_wells = side_well_count + other_well_count
+        
+        # one side well = 1, any other combination gets penalized
+        return np.where((side_well_count == 1) & (other_well_count == 0), 1, -total_wells)
+
+
+
+
+class BeamState: 
+    # one simulated board in the lookahead beam
+    # (has a .board like TetrisGame so the MoveScanner can scan it directly)
+    def __init__(self, board, current_piece_key, held_piece_key, queue, first_move=None, first_swap=False, lines_bonus=0): 
+        self.board = board
+        self.current_piece_key = current_piece_key
+        self.held_piece_key = held_piece_key
+        self.queue = queue # known upcoming pieces (from the preview)
+        
+        # the real move this line of play started with
+        self.first_move = first_move
+        self.first_swap = first_swap
+        
+        # lines weight * lines cleared earlier in this line of play (cleared rows don't show up in later board scores)
+        self.lines_bonus = lines_bonus
+        
+    def get_options(self): 
+        # (piece to place, held piece after, queue after, swapped hold?) for keeping and for swapping the piece
+        options = [(self.current_piece_key, self.held_piece_key, self.queue, False)]
+        if(self.held_piece_key is not None): 
+            if(self.held_piece_key != self.current_piece_key): # swapping a piece for the same piece changes nothing
+                options.append((self.held_piece_key, self.current_piece_key, self.queue, True))
+        elif(self.queue): # first hold takes the next piece
+            options.append((self.queue[0], self.current_piece_key, self.queue[1:], True))
+        return options
+
+
+
+
 class GeneticPlayer: 
-    def __init__(self, weights):
+    def __init__(self, weights, batch_evaluation=BATCH_EVALUATION_TOGGLE, lookahead_depth=LOOKAHEAD_DEPTH, beam_width=BEAM_WIDTH, profiler=NULL_PROFILER, movement_model=MOVEMENT_MODEL):
         self.weights = weights
-        self.scanner = MoveScanner()
+        self.compiled_weights = compile_weights(weights)
+        self.profiler = profiler # times move generation/evaluation/board copies when it's a real Profiler
+        self.scanner = MoveScanner(profiler=profiler, movement_model=movement_model)
         self.evaluator = BoardEvaluator()
         
+        self.batch_evaluator = None
+        if(batch_evaluation and np is not None): 
+            self.batch_evaluator = BatchBoardEvaluator()
+            
+        self.lookahead_depth = lookahead_depth
+        self.beam_width = beam_width
+        
     def get_best_move(self, game):
+        if(self.lookahead_depth > 0): 
+            return self.get_best_move_beam(game)
+        return self.get_best_move_greedy(game)
+        
+    def get_best_move_greedy(self, game): 
+        profiler = self.profiler
+        moves, extra_moves = self.get_candidate_moves(game)
+        
+        start = profiler.start()
+        best_move, swap_hold = self._pick_best(game, moves, extra_moves)
+        profiler.stop("evaluation", start)
+        profiler.count("moves_scored", len(moves) + len(extra_moves))
+        
+        return best_move, swap_hold
+    
+    def get_candidate_moves(self, game): 
+        # (moves for the current piece, moves for the held piece) = every choice the greedy player has this turn
+        profiler = self.profiler
+        
         # use MoveScanner to get all moves
+        start = profiler.start()
         moves = self.scanner.get_all_legal_moves(game, game.current_piece_key)
+        profiler.stop("move_generation", start)
         
         held_piece = game.held_piece_key
         if(game.held_piece_key is None): 
             held_piece = game.get_piece_preview()[0]
         
         extra_moves = []
-        extra_moves = self.scanner.get_all_legal_moves(game, held_piece)
+        if(held_piece != game.current_piece_key or not self.scanner.dedupe): 
+            # holding the same piece gives the same placements again (just with a swap), so those get skipped
+            start = profiler.start()
+            extra_moves = self.scanner.get_all_legal_moves(game, held_piece)
+            profiler.stop("move_generation", start)
+        
+        return moves, extra_moves
+    
+    def _pick_best(self, game, moves, extra_moves): 
+        if(self.batch_evaluator is not None and self._can_batch(moves, extra_moves)): 
+            candidates = moves + extra_moves
+            best_index = self.batch_evaluator.get_best_index(game.board, candidates, self.weights)
+            return candidates[best_index], best_index >= len(moves)
         
         best_score = -float('inf')
         best_move = None
@@ -153,11 +436,8 @@ class GeneticPlayer:
         
         # use BoardEvaluator to score possible moves
         for move in moves: 
-            # get board_state
-            board_state = game.return_board_state(move)
-            
-            # calculate score
-            score = self.evaluator.get_score(board_state, self.weights)
+            # calculate score (from the board's incremental stats, nothing gets copied)
+            score = self.score_move(game.board, move)
             
             # track winning move
             if score > best_score: 
@@ -165,11 +445,8 @@ class GeneticPlayer:
                 best_move = move
                 
         for move in extra_moves: 
-            # get board_state
-            board_state = game.return_board_state(move)
-            
-            # calculate score
-            score = self.evaluator.get_score(board_state, self.weights)
+            # calculate score (from the board's incremental stats, nothing gets copied)
+            score = self.score_move(game.board, move)
             
             # track winning move
             if score > best_score: 
@@ -179,6 +456,108 @@ class GeneticPlayer:
             
         return best_move, swap_hold
     
+    def get_best_move_beam(self, game): 
+        # beam search: place a piece on every board in the beam (with or without a hold swap),
+        # keep the beam_width best resulting boards, then do the same with the next preview piece
+        # cost per piece is beam_width * (moves for current + held), not the whole tree
+        profiler = self.profiler
+        queue = game.get_piece_preview()
+        depth = min(self.lookahead_depth, len(queue))
+        lines_weight = self.weights.get("lines", 0)
+        
+        beam = [BeamState(game.board, game.current_piece_key, game.held_piece_key, queue)]
+        best_state = None
+        best_leaf = None # (score, first move, first swap) of the best line whose queue ran out before depth
+        for ply in range(depth + 1): 
+            candidates = []
+            for state in beam: 
+                for piece_key, held_piece_key, queue_after, swapped in state.get_options(): 
+                    start = profiler.start()
+                    moves = self.scanner.get_all_legal_moves(state, piece_key)
+                    profiler.stop("move_generation", start)
+                    
+                    # a first hold uses up a preview piece, so that line runs out of known pieces a ply early
+                    # (placements that empty the queue are final, they don't get expanded or take beam slots)
+                    is_leaf = ply < depth and not queue_after
+                    
+                    start = profiler.start()
+                    for move in moves: 
+                        score = self.score_move(state.board, move) + state.lines_bonus
+                        if(is_leaf): 
+                            if(best_leaf is None or score > best_leaf[0]): 
+                                if(state.first_move is None): 
+                                    best_leaf = (score, move, swapped)
+                                else: 
+                                    best_leaf = (score, state.first_move, state.first_swap)
+                        else: 
+                            candidates.append((score, state, move, held_piece_key, queue_after, swapped))
+                    profiler.stop("evaluation", start)
+                    profiler.count("moves_scored", len(moves))
+            
+            if(not candidates): 
+                break # every board in the beam is dead, go with the best from the last piece
+            
+            # ties keep the order moves were found in (same as the greedy loop)
+            top = heapq.nlargest(self.beam_width, candidates, key=lambda candidate: candidate[0])
+            
+            if(ply == depth): 
+                score, state, move, held_piece_key, queue_after, swapped = top[0]
+                if(best_leaf is not None and best_leaf[0] > score): 
+                    return best_leaf[1], best_leaf[2]
+                if(state.first_move is None): 
+                    return move, swapped
+                return state.first_move, state.first_swap
+            
+            # simulate the placements that made the cut
+            next_beam = []
+            for score, state, move, held_piece_key, queue_after, swapped in top: 
+                x, y, r, pk, T_spin = move
+                start = profiler.start()
+                board = state.board.copy()
+                board.lock_piece(x, y, r, pk)
+                lines = board.clear_lines()
+                profiler.stop("materialization", start)
+                
+                # next piece comes off the queue, skip boards where it can't spawn (topped out)
+                next_piece_key = queue_after[0]
+                if(not can_spawn(board, next_piece_key)): 
+                    continue
+                
+                if(state.first_move is None): 
+                    first_move, first_swap = move, swapped
+                else: 
+                    first_move, first_swap = state.first_move, state.first_swap
+                    
+                next_beam.append(BeamState(board, next_piece_key, held_piece_key, queue_after[1:], 
+                                           first_move, first_swap, state.lines_bonus + lines * lines_weight))
+                if(best_state is None or ply > best_state[0]): 
+                    best_state = (ply, first_move, first_swap)
+            
+            if(not next_beam): 
+                break
+            beam = next_beam
+        
+        # lookahead ran out of live boards, fall back to the best line that ran out of pieces,
+        # then the deepest surviving line (or plain greedy)
+        if(best_leaf is not None): 
+            return best_leaf[1], best_leaf[2]
+        if(best_state is not None): 
+            return best_state[1], best_state[2]
+        return self.get_best_move_greedy(game)
+    
+    def _can_batch(self, moves, extra_moves): 
+        # pieces poking out the top of the board change the real board when they're scored one by one
+        # (negative row indexes), so those turns stay on the reference path to keep games identical
+        if(not moves and not extra_moves): 
+            return False
+        for x, y, r, pk, T_spin in moves + extra_moves: 
+            if(y + PIECE_TABLE[pk][r % 4]['bbox'][1] < 0): 
+                return False
+        return True
+    
+    def score_move(self, board, move): 
+        return self.evaluator.score_features(self.evaluator.placement_features(board, move), self.compiled_weights)
+    
     def get_genome(self): 
         return self.weights
     
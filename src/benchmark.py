@@ -0,0 +1,374 @@
+from tetris_engine import TetrisGame, Board, ListBoard, MoveScanner, SHAPES
+from ai_player import GeneticPlayer, BoardEvaluator, compile_weights
+from debug import T_SPIN_DEBUG_BOARD, BoardOnly
+from stress_boards import stress_boards
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+# Benchmark settings (fixed so numbers are comparable between runs)
+BENCH_SEEDS = [0, 1, 2]
+BENCH_REPEATS = 3 # every timing is the best of this many runs
+CORPUS_GAME_SNAPSHOTS = [0, 25, 50, 100] # piece counts to snapshot boards from seeded games at
+GAME_PIECES = 200 # pieces per end-to-end game
+
+OUTPUT_PATH = "bench_output.txt"
+BASELINE_PATH = "bench_baseline.json"
+REGRESSION_TOLERANCE = 0.15 # 15% worse than baseline = regression
+
+# fixed weights (BrainV10) so a new best_brain.json doesn't change the numbers
+BENCH_WEIGHTS = {
+    "height": -24.70982643996063,
+    "holes": -48.492629336989765,
+    "bumpiness": -4.58143547033227,
+    "wells": 38.63676542231037,
+    "lines": 0.414055634543524
+}
+
+
+# --------------------------BOARD CORPUS--------------------------
+# scenario sources: name -> function returning [(board name, grid), ...]
+# everything is seeded so the corpus is the same on every run
+
+def debug_boards(): 
+    empty = [[0] * 10 for _ in range(20)]
+    return [("empty", empty), ("t_spin_debug", T_SPIN_DEBUG_BOARD)]
+
+def game_boards(): 
+    # boards from seeded AI games, snapshotted at a few piece counts
+    boards = []
+    for seed in BENCH_SEEDS: 
+        game = TetrisGame(seed)
+        player = GeneticPlayer(BENCH_WEIGHTS)
+        for pieces in range(max(CORPUS_GAME_SNAPSHOTS) + 1): 
+            if(pieces in CORPUS_GAME_SNAPSHOTS): 
+                boards.append((f"game_s{seed}_p{pieces}", game.board.board))
+            if(game.game_over): 
+                break
+            game.step(*player.get_best_move(game))
+    return boards
+
+SCENARIO_SOURCES = {
+    "debug": debug_boards,
+    "games": game_boards,
+    "stress": stress_boards # adversarial boards (stress_boards.py)
+}
+
+def build_corpus(sources=None): 
+    corpus = []
+    for name in (sources or SCENARIO_SOURCES): 
+        corpus.extend(SCENARIO_SOURCES[name]())
+    return corpus
+
+def make_board(grid, board_class=Board): 
+    board = board_class(len(grid), len(grid[0]))
+    board.board = [row[:] for row in grid]
+    return board
+
+
+class PositionOnly(BoardOnly): 
+    # what GeneticPlayer.get_best_move reads off a TetrisGame (board, current/held piece, preview)
+    def __init__(self, board, current_piece_key, held_piece_key=None, preview=("I", "T", "O")): 
+        super().__init__(board)
+        self.current_piece_key = current_piece_key
+        self.held_piece_key = held_piece_key
+        self.preview = list(preview)
+    
+    def get_piece_preview(self): 
+        return self.preview
+
+
+# --------------------------TIMING--------------------------
+
+def best_time(func, repeats=BENCH_REPEATS): 
+    # best of N (least disturbed by whatever else the machine is doing)
+    best = float('inf')
+    for _ in range(repeats): 
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def tail_latency(timings): 
+    # (p99, max) of per-call timings
+    return statistics.quantiles(timings, n=100, method="inclusive")[98], max(timings)
+
+
+def time_each(calls, repeats=BENCH_REPEATS): 
+    # best of N for every (label, setup, func) on its own, setup isn't timed
+    # returns [(seconds, label)], so the tail shows which boards are slow (not which run got unlucky)
+    timings = []
+    for label, setup, func in calls: 
+        best = float('inf')
+        for _ in range(repeats): 
+            argument = setup()
+            start = time.perf_counter()
+            func(argument)
+            best = min(best, time.perf_counter() - start)
+        timings.append((best, label))
+    return timings
+
+
+def bench_is_valid_position(corpus, board_class): 
+    # every piece/rotation at every position in (and a bit around) the matrix, on every board
+    probes = []
+    boards = []
+    for name, grid in corpus: 
+        board = make_board(grid, board_class)
+        boards.append(board)
+        for pk in SHAPES: 
+            for r in range(4): 
+                for x in range(-2, board.width): 
+                    for y in range(-2, board.height): 
+                        probes.append((board, x, y, r, pk))
+    
+    def run(): 
+        for board, x, y, r, pk in probes: 
+            board.is_valid_position(x, y, r, pk)
+    
+    return len(probes) / best_time(run)
+
+
+def bench_legal_moves(corpus, board_class, movement_model="srs"): 
+    # move generation for all 7 pieces on every board (cache off so every call really scans)
+    scanner = MoveScanner(cache_size=0, movement_model=movement_model)
+    games = [BoardOnly(make_board(grid, board_class)) for name, grid in corpus]
+    
+    def run(): 
+        for game in games: 
+            for pk in SHAPES: 
+                scanner.get_all_legal_moves(game, pk)
+    
+    return best_time(run) / (len(games) * len(SHAPES)) * 1e6
+
+
+def bench_legal_moves_tail(corpus): 
+    # one scan per (board, piece), cache off, for the p99/max scan instead of the average
+    scanner = MoveScanner(cache_size=0)
+    calls = []
+    for name, grid in corpus: 
+        game = BoardOnly(make_board(grid))
+        for pk in SHAPES: 
+            calls.append((f"{name} {pk}", lambda game=game: game, lambda game, pk=pk: scanner.get_all_legal_moves(game, pk)))
+    return time_each(calls)
+
+
+def bench_best_move_tail(corpus): 
+    # one whole greedy decision per (board, piece) (both scans + scoring), on a fresh board every time
+    # (scoring pieces poking out the top changes the board it's done on)
+    player = GeneticPlayer(BENCH_WEIGHTS)
+    player.scanner = MoveScanner(cache_size=0)
+    calls = []
+    for name, grid in corpus: 
+        for pk in SHAPES: 
+            calls.append((f"{name} {pk}", lambda grid=grid, pk=pk: PositionOnly(make_board(grid), pk), player.get_best_move))
+    return time_each(calls)
+
+
+def bench_get_score(corpus): 
+    evaluator = BoardEvaluator()
+    grids = [grid for name, grid in corpus]
+    calls = 50
+    
+    def run(): 
+        for _ in range(calls): 
+            for grid in grids: 
+                evaluator.get_score(grid, BENCH_WEIGHTS)
+    
+    return best_time(run) / (calls * len(grids)) * 1e6
+
+
+def bench_placement_score(corpus): 
+    # scoring every legal move of every piece through the Board's incremental stats, on a fresh board every time
+    # (scoring pieces poking out the top changes the board it's done on)
+    evaluator = BoardEvaluator()
+    scanner = MoveScanner(cache_size=0)
+    jobs = []
+    for name, grid in corpus: 
+        board = make_board(grid)
+        for pk in SHAPES: 
+            for move in scanner.get_all_legal_moves(BoardOnly(board), pk): 
+                jobs.append((grid, move))
+    
+    def run(): 
+        # boards get built ahead of the timed loop, so only the scoring is timed
+        boards = [make_board(grid) for grid, move in jobs]
+        start = time.perf_counter()
+        for board, (grid, move) in zip(boards, jobs): 
+            evaluator.get_placement_score(board, move, BENCH_WEIGHTS)
+        return time.perf_counter() - start
+    
+    return min(run() for _ in range(BENCH_REPEATS)) / len(jobs) * 1e6
+
+
+def bench_score_matrix(corpus, genomes=30): 
+    # candidate features extracted once, then scored under a whole population in one call (per candidate x genome score)
+    evaluator = BoardEvaluator()
+    scanner = MoveScanner(cache_size=0)
+    features = []
+    for name, grid in corpus: 
+        for move in scanner.get_all_legal_moves(BoardOnly(make_board(grid)), "T"): 
+            # features come from a fresh board (scoring pieces poking out the top changes the board it's done on)
+            features.append(evaluator.placement_features(make_board(grid), move))
+    rng = random.Random(0)
+    compiled = [compile_weights({key: value * rng.uniform(0.5, 1.5) for key, value in BENCH_WEIGHTS.items()}) for _ in range(genomes)]
+    
+    def run(): 
+        evaluator.score_matrix(features, compiled)
+    
+    return best_time(run) / (len(features) * genomes) * 1e6
+
+
+def record_games(): 
+    # (seed, [(move, swap_hold), ...]) from seeded AI games, replayed by bench_step
+    recordings = []
+    for seed in BENCH_SEEDS: 
+        game = TetrisGame(seed)
+        player = GeneticPlayer(BENCH_WEIGHTS)
+        steps = []
+        while(not game.game_over and len(steps) < GAME_PIECES): 
+            move, swap_hold = player.get_best_move(game)
+            steps.append((move, swap_hold))
+            game.step(move, swap_hold)
+        recordings.append((seed, steps))
+    return recordings
+
+
+def bench_step(recordings): 
+    total_steps = sum(len(steps) for seed, steps in recordings)
+    
+    def run(): 
+        for seed, steps in recordings: 
+            game = TetrisGame(seed)
+            for move, swap_hold in steps: 
+                game.step(move, swap_hold)
+    
+    return total_steps / best_time(run)
+
+
+def bench_games(): 
+    # end to end, scanner + evaluator + engine (one run, games are long enough to be stable)
+    pieces = 0
+    start = time.perf_counter()
+    for seed in BENCH_SEEDS: 
+        game = TetrisGame(seed)
+        player = GeneticPlayer(BENCH_WEIGHTS)
+        game_pieces = 0
+        while(not game.game_over and game_pieces < GAME_PIECES): 
+            game.step(*player.get_best_move(game))
+            game_pieces += 1
+        pieces += game_pieces
+    return pieces / (time.perf_counter() - start)
+
+
+# --------------------------RUNNING--------------------------
+
+def run_benchmarks(sources=None): 
+    # returns {name: {"value", "unit", "higher_is_better"}}
+    corpus = build_corpus(sources)
+    results = {}
+    
+    def add(name, value, unit, higher_is_better): 
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"  {name}: {value:,.2f} {unit}", flush = True)
+    
+    print(f"corpus: {len(corpus)} boards")
+    add("is_valid_position[Board]", bench_is_valid_position(corpus, Board), "calls/s", True)
+    add("is_valid_position[ListBoard]", bench_is_valid_position(corpus, ListBoard), "calls/s", True)
+    add("get_all_legal_moves[Board]", bench_legal_moves(corpus, Board), "us/scan", False)
+    add("get_all_legal_moves[ListBoard]", bench_legal_moves(corpus, ListBoard), "us/scan", False)
+    add("get_all_legal_moves[soft_drop]", bench_legal_moves(corpus, Board, "soft_drop"), "us/scan", False)
+    add("get_all_legal_moves[hard_drop]", bench_legal_moves(corpus, Board, "hard_drop"), "us/scan", False)
+    for name, timings in (("get_all_legal_moves", bench_legal_moves_tail(corpus)), ("GeneticPlayer.get_best_move", bench_best_move_tail(corpus))): 
+        p99, worst = tail_latency([seconds for seconds, label in timings])
+        add(f"{name}.p99", p99 * 1e6, "us/call", False)
+        add(f"{name}.max", worst * 1e6, "us/call", False)
+        print(f"    slowest: {', '.join(label for seconds, label in sorted(timings, reverse = True)[:3])}")
+    add("BoardEvaluator.get_score", bench_get_score(corpus), "us/board", False)
+    add("BoardEvaluator.get_placement_score", bench_placement_score(corpus), "us/move", False)
+    add("BoardEvaluator.score_matrix", bench_score_matrix(corpus), "us/score", False)
+    add("TetrisGame.step", bench_step(record_games()), "steps/s", True)
+    add("GeneticPlayer.pieces", bench_games(), "pieces/s", True)
+    
+    return results
+
+
+def compare(results, baseline): 
+    # returns names that got worse than the baseline by more than REGRESSION_TOLERANCE
+    regressions = []
+    print(f"{'benchmark':<38}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, result in results.items(): 
+        if(name not in baseline): 
+            print(f"{name:<38}{'-':>14}{result['value']:>14,.2f}{'new':>10}")
+            continue
+        
+        old = baseline[name]["value"]
+        new = result["value"]
+        # positive change = faster
+        if(result["higher_is_better"]): 
+            change = new / old - 1
+        else: 
+            change = old / new - 1
+        
+        flag = ""
+        if(change < -REGRESSION_TOLERANCE): 
+            flag = "  <-- REGRESSION"
+            regressions.append(name)
+        print(f"{name:<38}{old:>14,.2f}{new:>14,.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(): 
+    parser = argparse.ArgumentParser(description="benchmarks for the engine, scanner, evaluator and full games")
+    parser.add_argument("--sources", nargs="+", choices=sorted(SCENARIO_SOURCES), help="board scenario sources to use (default: all)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="where to write the results (JSON lines)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the new baseline")
+    args = parser.parse_args()
+    
+    meta = {
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sources": sorted(args.sources or SCENARIO_SOURCES)
+    }
+    print(f"running benchmarks ({meta['python']})...")
+    results = run_benchmarks(args.sources)
+    
+    # one JSON object per line: meta first, then one per benchmark
+    with open(args.output, "w") as w: 
+        w.write(json.dumps({"meta": meta}) + "\n")
+        for name, result in results.items(): 
+            w.write(json.dumps({"name": name, **result}) + "\n")
+    print(f"Saved to {args.output}")
+    
+    if(args.save_baseline): 
+        with open(args.baseline, "w") as w: 
+            json.dump({"meta": meta, "results": results}, w, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+    
+    if(not os.path.exists(args.baseline)): 
+        print(f"No baseline at {args.baseline} (run with --save-baseline to make one)")
+        return
+    
+    with open(args.baseline, "r") as r: 
+        baseline = json.load(r)
+    print(f"Comparing against baseline from {baseline['meta']['time']} ({baseline['meta']['python']})")
+    if(baseline["meta"].get("sources") != meta["sources"]): 
+        print(f"WARNING: baseline used scenario sources {baseline['meta'].get('sources')}, this run used {meta['sources']}")
+    regressions = compare(results, baseline["results"])
+    if(regressions): 
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
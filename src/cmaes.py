@@ -0,0 +1,189 @@
+import math
+import random
+
+# CMA-ES (covariance matrix adaptation evolution strategy) over genome weight dicts, pure python (no numpy needed)
+# samples a population around a mean, then moves the mean toward the best half and reshapes the sampling
+# distribution (covariance + step size) to follow the directions that kept paying off
+# with only a handful of weights this needs a lot fewer games than the GA to settle on good weights
+#
+# restarts (IPOP): once the search has converged (tiny steps, no progress for a while or a flat generation)
+# it starts over from a new random genome with a bigger population, the best genome ever seen is kept by the trainer
+#
+# ask() -> genomes to play, tell(population_results) with the scores sorted best first (same as the GA's breed)
+# random numbers come from the random module, so TRAINING_SEED and checkpoints cover it like the rest of the trainer
+
+
+def jacobi_eigen(matrix, sweeps=50): 
+    # eigen decomposition of a small symmetric matrix (cyclic Jacobi rotations)
+    # returns (eigenvalues, eigenvectors as the columns of a matrix)
+    n = len(matrix)
+    a = [row[:] for row in matrix]
+    vectors = [[float(i == j) for j in range(n)] for i in range(n)]
+    
+    for _ in range(sweeps): 
+        off_diagonal = sum(a[i][j]**2 for i in range(n) for j in range(i + 1, n))
+        if(off_diagonal < 1e-30): 
+            break
+        
+        for p in range(n): 
+            for q in range(p + 1, n): 
+                if(a[p][q] == 0): 
+                    continue
+                theta = (a[q][q] - a[p][p]) / (2 * a[p][q])
+                t = math.copysign(1, theta) / (abs(theta) + math.sqrt(theta**2 + 1))
+                c = 1 / math.sqrt(t**2 + 1)
+                s = t * c
+                
+                for k in range(n): 
+                    a_kp, a_kq = a[k][p], a[k][q]
+                    a[k][p] = c * a_kp - s * a_kq
+                    a[k][q] = s * a_kp + c * a_kq
+                for k in range(n): 
+                    a_pk, a_qk = a[p][k], a[q][k]
+                    a[p][k] = c * a_pk - s * a_qk
+                    a[q][k] = s * a_pk + c * a_qk
+                for k in range(n): 
+                    v_kp, v_kq = vectors[k][p], vectors[k][q]
+                    vectors[k][p] = c * v_kp - s * v_kq
+                    vectors[k][q] = s * v_kp + c * v_kq
+    
+    return [a[i][i] for i in range(n)], vectors
+
+
+
+class CMAES: 
+    def __init__(self, make_genome, sigma, population_size=None, restart_population_factor=2, stagnation=10, tol_x=1e-3, max_condition=1e14): 
+        self.make_genome = make_genome # where (re)starts begin (ai_player.generate_random_genome)
+        self.start_sigma = sigma # step size at every (re)start, in weight units
+        self.restart_population_factor = restart_population_factor
+        self.stagnation = stagnation # generations without a better best before restarting
+        self.tol_x = tol_x # restart once steps are smaller than this (in every direction)
+        self.max_condition = max_condition # restart once the covariance gets too stretched
+        
+        genome = make_genome()
+        self.keys = list(genome)
+        self.n = len(self.keys)
+        self.restarts = 0
+        self.population_size = population_size or 4 + int(3 * math.log(self.n)) # the usual default, 8 for 5 weights
+        self.start(genome)
+    
+    def start(self, genome): 
+        # fresh search around genome (also used by restarts)
+        n = self.n
+        self.set_strategy_parameters()
+        self.mean = [genome[key] for key in self.keys]
+        self.sigma = self.start_sigma
+        self.C = [[float(i == j) for j in range(n)] for i in range(n)]
+        self.B = [[float(i == j) for j in range(n)] for i in range(n)]
+        self.D = [1.0] * n
+        self.pc = [0.0] * n
+        self.ps = [0.0] * n
+        self.generation = 0
+        self.best_score = None
+        self.best_generation = 0
+    
+    def set_strategy_parameters(self): 
+        # learning rates from Hansen's CMA-ES tutorial (they only depend on n and the population size)
+        n = self.n
+        self.mu = self.population_size // 2
+        raw_weights = [math.log((self.population_size + 1) / 2) - math.log(i + 1) for i in range(self.mu)]
+        self.weights = [w / sum(raw_weights) for w in raw_weights]
+        self.mueff = 1 / sum(w**2 for w in self.weights)
+        
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3)**2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2)**2 + self.mueff))
+        self.damps = 1 + 2 * max(0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chiN = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n**2))
+    
+    @property
+    def selection_count(self): 
+        # how many of the best genomes tell() recombines (the trainer never races or screens below this)
+        return self.mu
+    
+    def ask(self): 
+        # samples population_size genomes around the mean
+        genomes = []
+        for _ in range(self.population_size): 
+            z = [self.D[i] * random.gauss(0, 1) for i in range(self.n)]
+            y = [sum(self.B[i][j] * z[j] for j in range(self.n)) for i in range(self.n)]
+            x = [self.mean[i] + self.sigma * y[i] for i in range(self.n)]
+            genomes.append(dict(zip(self.keys, x)))
+        return genomes
+    
+    def tell(self, population_results): 
+        # population_results: [(fitness score, genome, moves)] for the last ask(), sorted best first
+        n = self.n
+        ranked = [[genome[key] for key in self.keys] for score, genome, moves in population_results]
+        old_mean = self.mean
+        self.generation += 1
+        
+        # new mean: weighted average of the best mu
+        self.mean = [sum(w * x[i] for w, x in zip(self.weights, ranked)) for i in range(n)]
+        step = [(self.mean[i] - old_mean[i]) / self.sigma for i in range(n)]
+        
+        # evolution paths (C^-1/2 * step = B * D^-1 * B^T * step)
+        bt_step = [sum(self.B[k][i] * step[k] for k in range(n)) / self.D[i] for i in range(n)]
+        c_inv_sqrt_step = [sum(self.B[i][k] * bt_step[k] for k in range(n)) for i in range(n)]
+        ps_scale = math.sqrt(self.cs * (2 - self.cs) * self.mueff)
+        self.ps = [(1 - self.cs) * self.ps[i] + ps_scale * c_inv_sqrt_step[i] for i in range(n)]
+        ps_norm = math.sqrt(sum(p**2 for p in self.ps))
+        
+        hsig = ps_norm / math.sqrt(1 - (1 - self.cs)**(2 * self.generation)) / self.chiN < 1.4 + 2 / (n + 1)
+        pc_scale = math.sqrt(self.cc * (2 - self.cc) * self.mueff)
+        self.pc = [(1 - self.cc) * self.pc[i] + hsig * pc_scale * step[i] for i in range(n)]
+        
+        # covariance: rank one (evolution path) + rank mu (this generation's best steps)
+        deltas = [[(x[i] - old_mean[i]) / self.sigma for i in range(n)] for x in ranked[:self.mu]]
+        c1a = self.c1 * (1 - (1 - hsig**2) * self.cc * (2 - self.cc))
+        for i in range(n): 
+            for j in range(n): 
+                rank_mu = sum(w * d[i] * d[j] for w, d in zip(self.weights, deltas))
+                self.C[i][j] = (1 - c1a - self.cmu) * self.C[i][j] + self.c1 * self.pc[i] * self.pc[j] + self.cmu * rank_mu
+        
+        # step size: grow if the path is longer than a random walk's, shrink if it's shorter
+        self.sigma *= math.exp(min(1, (self.cs / self.damps) * (ps_norm / self.chiN - 1)))
+        
+        # B and D (sampling directions and lengths) from the new covariance, cheap with this few weights
+        self.update_eigen()
+        
+        best_score = population_results[0][0]
+        if(self.best_score is None or best_score > self.best_score): 
+            self.best_score = best_score
+            self.best_generation = self.generation
+        
+        reason = self.restart_reason(population_results)
+        if(reason): 
+            self.restart()
+        return reason
+    
+    def update_eigen(self): 
+        eigenvalues, self.B = jacobi_eigen(self.C)
+        self.D = [math.sqrt(max(value, 1e-20)) for value in eigenvalues]
+    
+    def restart_reason(self, population_results): 
+        # why the search should start over (None = keep going)
+        if(population_results[0][0] == population_results[-1][0]): 
+            return "flat fitness"
+        if(self.sigma * max(self.D) < self.tol_x): 
+            return "converged"
+        if(self.generation - self.best_generation >= self.stagnation): 
+            return "stagnation"
+        if(max(self.D)**2 > self.max_condition * min(self.D)**2): 
+            return "ill conditioned"
+        return None
+    
+    def restart(self): 
+        self.restarts += 1
+        self.population_size *= self.restart_population_factor
+        self.start(self.make_genome())
+    
+    def to_json(self): 
+        return {key: getattr(self, key) for key in ("restarts", "population_size", "mean", "sigma", "C", "B", "D", "pc", "ps",
+                                                    "generation", "best_score", "best_generation")}
+    
+    def load_json(self, data): 
+        for key, value in data.items(): 
+            setattr(self, key, value)
+        self.set_strategy_parameters()
@@ -0,0 +1,416 @@
+from tetris_engine import TetrisGame, Board, ListBoard, MoveScanner, SHAPES, PIECE_TABLE, dedupe_placements, can_spawn
+from ai_player import BoardEvaluator, BatchBoardEvaluator, GeneticPlayer, compile_weights, np
+from debug import T_SPIN_DEBUG_BOARD, BoardOnly
+from benchmark import BENCH_WEIGHTS
+from stress_boards import random_stress_board
+from settings import PIECE_PREVIEW_AMOUNT
+import argparse
+import random
+import sys
+
+# Differential conformance harness
+# runs the reference (pure python list[list[int]]) implementations and every faster path on the same
+# seeded boards and games, and complains about ANY difference:
+#     is_valid_position    Board vs ListBoard, every piece/rotation/position
+#     legal_moves          MoveScanner on Board (cached and uncached) vs ListBoard, exact lists incl. T-spin flags,
+#                          and deduped lists still covering every distinct placement
+#     lock_clear           Board lock/unlock/clear_lines (+ incremental stats and hash) vs ListBoard
+#     evaluator            BoardEvaluator.get_score vs get_board_score, get_placement_score, BatchBoardEvaluator
+#                          and score_matrix (every candidate under several genomes at once)
+#     step                 whole seeded games (random legal moves) on Board vs ListBoard, every TetrisGame.step
+#     lookahead            seeded games played by the beam search player on Board vs ListBoard at every depth up to
+#                          PIECE_PREVIEW_AMOUNT (a first hold uses up a preview piece, so the deepest one runs out of queue)
+# a mismatch gets shrunk (rows, then single cells removed while it still fails) down to a minimal board repro
+
+BOARD_HEIGHT = 20
+BOARD_WIDTH = 10
+BOARDS = 100 # generated boards
+GAMES = 10 # seeded games for the step check (and board snapshots)
+GAME_PIECES = 150
+HOLD_CHANCE = 0.2 # random games swap hold this often
+SNAPSHOT_EVERY = 10 # pieces between board snapshots from the games
+LOOKAHEAD_PIECES = 40 # pieces per lookahead game (one game per depth)
+LOOKAHEAD_BEAM_WIDTH = 3
+
+WEIGHTS = BENCH_WEIGHTS
+MATRIX_WEIGHTS = [WEIGHTS] + [{key: value * scale for key, value in WEIGHTS.items()} for scale in (0.5, -1.5)] # genomes for score_matrix
+
+
+# --------------------------BOARDS--------------------------
+
+def empty_grid(height=BOARD_HEIGHT, width=BOARD_WIDTH): 
+    return [[0] * width for _ in range(height)]
+
+def garbage_board(rng): 
+    # garbage rows (one hole each) under a random rough surface
+    grid = empty_grid()
+    garbage = rng.randint(1, 10)
+    for y in range(BOARD_HEIGHT - garbage, BOARD_HEIGHT): 
+        hole = rng.randrange(BOARD_WIDTH)
+        grid[y] = [0 if x == hole else 1 for x in range(BOARD_WIDTH)]
+    for x in range(BOARD_WIDTH): 
+        for y in range(BOARD_HEIGHT - garbage - rng.randint(0, 4), BOARD_HEIGHT - garbage): 
+            grid[y][x] = 1
+    return grid
+
+def stack_board(rng): 
+    # random column heights with holes punched in and some full rows (line clears)
+    grid = empty_grid()
+    max_height = rng.randint(2, BOARD_HEIGHT - 2)
+    for x in range(BOARD_WIDTH): 
+        for y in range(BOARD_HEIGHT - rng.randint(0, max_height), BOARD_HEIGHT): 
+            grid[y][x] = 0 if rng.random() < 0.15 else 1
+    for _ in range(rng.randint(0, 3)): 
+        grid[rng.randrange(BOARD_HEIGHT - max_height, BOARD_HEIGHT)] = [1] * BOARD_WIDTH
+    return grid
+
+def noise_board(rng): 
+    # cells get more likely further down, with floating blocks and overhangs near the top (T-spin slots, tucks)
+    density = rng.uniform(0.2, 0.6)
+    return [[1 if rng.random() < density * y / BOARD_HEIGHT else 0 for x in range(BOARD_WIDTH)] for y in range(BOARD_HEIGHT)]
+
+BOARD_GENERATORS = (garbage_board, stack_board, noise_board, random_stress_board)
+
+def generate_boards(count, rng): 
+    boards = [("empty", empty_grid()), ("t_spin_debug", [row[:] for row in T_SPIN_DEBUG_BOARD])]
+    for i in range(count): 
+        generator = BOARD_GENERATORS[i % len(BOARD_GENERATORS)]
+        boards.append((f"{generator.__name__}_{i}", generator(rng)))
+    return boards
+
+def make_board(grid, board_class): 
+    board = board_class(len(grid), len(grid[0]))
+    board.board = [row[:] for row in grid]
+    return board
+
+def is_wrapped(move): 
+    # pieces poking out the top write to negative rows (the bottom of the board), only the reference path is defined there
+    x, y, r, pk, T_spin = move
+    return y + PIECE_TABLE[pk][r % 4]['bbox'][1] < 0
+
+def reference_moves(grid, pk): 
+    # legal moves from the reference scanner, none if the piece can't spawn
+    # (that's game over, the BFS start would overlap the stack and nothing ever gets placed)
+    board = make_board(grid, ListBoard)
+    if(not can_spawn(board, pk)): 
+        return []
+    return MoveScanner(cache_size=0, dedupe=False).scan(board, pk)
+
+def board_stats(board): 
+    return (board.heights[:], board.col_holes[:], board.row_counts[:], board.full_rows, board.hash)
+
+
+# --------------------------BOARD CHECKS--------------------------
+# each takes (grid, piece key) and returns None or a description of the first difference
+
+def check_is_valid_position(grid, pk): 
+    fast = make_board(grid, Board)
+    reference = make_board(grid, ListBoard)
+    for r in range(4): 
+        for x in range(-3, len(grid[0]) + 1): 
+            for y in range(-3, len(grid) + 1): 
+                expected = reference.is_valid_position(x, y, r, pk)
+                if(fast.is_valid_position(x, y, r, pk) != expected): 
+                    return f"is_valid_position({x}, {y}, {r}, {pk!r}): reference {expected}"
+    return None
+
+def check_legal_moves(grid, pk): 
+    expected = MoveScanner(cache_size=0, dedupe=False).scan(make_board(grid, ListBoard), pk)
+    fast_board = make_board(grid, Board)
+    
+    uncached = MoveScanner(cache_size=0, dedupe=False).scan(fast_board, pk)
+    if(uncached != expected): 
+        return list_difference("uncached Board scan", uncached, expected)
+    
+    cached_scanner = MoveScanner(dedupe=False)
+    for attempt in ("first", "cached"): 
+        moves = cached_scanner.get_all_legal_moves(BoardOnly(fast_board), pk)
+        if(moves != expected): 
+            return list_difference(f"{attempt} cached Board scan", moves, expected)
+    
+    # dedupe: every distinct set of cells still there once, with the best T-spin flag any copy of it had
+    def placements(moves): 
+        best = {}
+        for move in moves: 
+            board = make_board(grid, ListBoard)
+            board.lock_piece(*move[:4])
+            cells = move if is_wrapped(move) else tuple(map(tuple, board.board))
+            best[cells] = max(best.get(cells, 0), move[4])
+        return best
+    deduped = dedupe_placements(expected)
+    if(len(placements(deduped)) != len(deduped) or placements(deduped) != placements(expected)): 
+        return f"dedupe_placements: {len(deduped)} moves for {len(placements(expected))} distinct placements (or lost a T-spin flag)"
+    return None
+
+def list_difference(name, moves, expected): 
+    for i, (move, expected_move) in enumerate(zip(moves, expected)): 
+        if(move != expected_move): 
+            return f"{name}: move #{i} is {move}, reference {expected_move}"
+    return f"{name}: {len(moves)} moves, reference {len(expected)}"
+
+def check_lock_clear(grid, pk): 
+    base = make_board(grid, Board)
+    if(base.board != grid): 
+        return "Board round trip changed the grid"
+    
+    for move in reference_moves(grid, pk): 
+        x, y, r, pk, T_spin = move
+        fast = make_board(grid, Board)
+        reference = make_board(grid, ListBoard)
+        
+        fast.lock_piece(x, y, r, pk)
+        reference.lock_piece(x, y, r, pk)
+        if(fast.board != reference.board): 
+            return f"lock_piece{move[:4]}: grids differ"
+        stats = board_stats(fast)
+        fast.recount()
+        if(stats != board_stats(fast)): 
+            return f"lock_piece{move[:4]}: incremental stats/hash {stats} != recount {board_stats(fast)}"
+        
+        if(not is_wrapped(move)): 
+            # unlocking has to put everything back exactly (wrapped pieces can overwrite cells, nothing to restore)
+            unlocked = make_board(grid, Board)
+            unlocked.lock_piece(x, y, r, pk)
+            unlocked.unlock_piece(x, y, r, pk)
+            if(unlocked.board != grid or board_stats(unlocked) != board_stats(base)): 
+                return f"unlock_piece{move[:4]}: board/stats not restored"
+        
+        lines = fast.clear_lines()
+        expected_lines = reference.clear_lines()
+        if(lines != expected_lines or fast.board != reference.board): 
+            return f"clear_lines after {move[:4]}: {lines} lines, reference {expected_lines} (or grids differ)"
+        stats = board_stats(fast)
+        fast.recount()
+        if(stats != board_stats(fast)): 
+            return f"clear_lines after {move[:4]}: stats/hash out of date"
+    return None
+
+def check_evaluator(grid, pk): 
+    evaluator = BoardEvaluator()
+    batch_evaluator = BatchBoardEvaluator() if np is not None else None
+    fast = make_board(grid, Board)
+    
+    if(evaluator.get_board_score(fast, WEIGHTS) != evaluator.get_score(grid, WEIGHTS)): 
+        return "get_board_score on the bare board"
+    
+    # wrapped moves change the board when scored one by one (bug compatible with the original), so they're skipped
+    moves = [move for move in reference_moves(grid, pk) if not is_wrapped(move)]
+    batch_scores = batch_evaluator.get_scores(fast, moves, WEIGHTS) if batch_evaluator is not None and moves else None
+    matrix = evaluator.score_matrix([evaluator.placement_features(fast, move) for move in moves], [compile_weights(weights) for weights in MATRIX_WEIGHTS])
+    for i, move in enumerate(moves): 
+        reference = make_board(grid, ListBoard)
+        reference.lock_piece(*move[:4])
+        expected = evaluator.get_score(reference.board, WEIGHTS)
+        
+        placement_score = evaluator.get_placement_score(fast, move, WEIGHTS)
+        if(placement_score != expected): 
+            return f"get_placement_score{move[:4]}: {placement_score!r}, reference {expected!r}"
+        
+        locked = make_board(grid, Board)
+        locked.lock_piece(*move[:4])
+        board_score = evaluator.get_board_score(locked, WEIGHTS)
+        if(board_score != expected): 
+            return f"get_board_score after {move[:4]}: {board_score!r}, reference {expected!r}"
+        
+        if(batch_scores is not None and float(batch_scores[i]) != expected): 
+            return f"BatchBoardEvaluator{move[:4]}: {float(batch_scores[i])!r}, reference {expected!r}"
+        
+        for g, weights in enumerate(MATRIX_WEIGHTS): 
+            expected = evaluator.get_score(reference.board, weights)
+            if(matrix[i][g] != expected): 
+                return f"score_matrix{move[:4]} genome {g}: {matrix[i][g]!r}, reference {expected!r}"
+    return None
+
+BOARD_CHECKS = {
+    "is_valid_position": check_is_valid_position,
+    "legal_moves": check_legal_moves,
+    "lock_clear": check_lock_clear,
+    "evaluator": check_evaluator
+}
+
+
+# --------------------------GAME CHECK--------------------------
+
+def game_state(game): 
+    return (game.score, game.level, game.lines_cleared, game.combo, game.previous_difficulty, game.game_over,
+            game.current_piece_key, game.held_piece_key, game.board.board)
+
+def make_step_check(move, swap_hold, state): 
+    # board check for one step from a fixed game state (level, combo, ...), so a step mismatch can be shrunk like the others
+    level, lines_cleared, combo, previous_difficulty, current_piece_key, held_piece_key, bag = state
+    
+    def check_step(grid, pk): 
+        games = []
+        for board_class in (ListBoard, Board): 
+            game = TetrisGame(0)
+            game.board = make_board(grid, board_class)
+            game.level, game.lines_cleared, game.combo, game.previous_difficulty = level, lines_cleared, combo, previous_difficulty
+            game.current_piece_key, game.held_piece_key, game.bag = current_piece_key, held_piece_key, bag[:]
+            game.step(move, swap_hold)
+            games.append(game_state(game))
+        if(games[0] != games[1]): 
+            return f"step({move}, {swap_hold}): reference {games[0][:8]}, Board {games[1][:8]}"
+        return None
+    return check_step
+
+def run_game(seed, pieces, snapshots): 
+    # plays the same seeded game on ListBoard and Board with random legal moves (picked from the reference),
+    # returns None or (description, grid, piece key, check) for the first step that differs
+    rng = random.Random(seed)
+    reference = TetrisGame(seed)
+    reference.board = ListBoard()
+    fast = TetrisGame(seed)
+    scanner = MoveScanner(cache_size=0, dedupe=False)
+    fast_scanner = MoveScanner(dedupe=False)
+    
+    for piece in range(pieces): 
+        if(reference.game_over): 
+            break
+        grid = reference.board.board
+        if(piece % SNAPSHOT_EVERY == 0): 
+            snapshots.append((f"game_{seed}_p{piece}", [row[:] for row in grid]))
+        
+        swap_hold = rng.random() < HOLD_CHANCE
+        piece_key = reference.current_piece_key
+        if(swap_hold): 
+            piece_key = reference.held_piece_key or reference.get_piece_preview()[0]
+        
+        moves = scanner.get_all_legal_moves(reference, piece_key)
+        fast_moves = fast_scanner.get_all_legal_moves(fast, piece_key)
+        if(fast_moves != moves): 
+            return list_difference(f"game {seed} piece {piece}", fast_moves, moves), grid, piece_key, check_legal_moves
+        if(not moves): 
+            break
+        
+        move = rng.choice(moves)
+        state = (reference.level, reference.lines_cleared, reference.combo, reference.previous_difficulty,
+                 reference.current_piece_key, reference.held_piece_key, reference.bag[:])
+        reference.step(move, swap_hold)
+        fast.step(move, swap_hold)
+        if(game_state(reference) != game_state(fast)): 
+            check = make_step_check(move, swap_hold, state)
+            return f"game {seed} piece {piece}: " + (check(grid, piece_key) or "states differ"), grid, piece_key, check
+    return None
+
+
+def run_lookahead(seed, pieces, depth): 
+    # plays the same seeded game with the beam search player on ListBoard and Board,
+    # returns None or a description of the first move that differs (or of the error the player raised)
+    games = []
+    for board_class in (ListBoard, Board): 
+        game = TetrisGame(seed)
+        game.board = board_class()
+        games.append((game, GeneticPlayer(WEIGHTS, lookahead_depth=depth, beam_width=LOOKAHEAD_BEAM_WIDTH)))
+    
+    for piece in range(pieces): 
+        choices = []
+        for game, player in games: 
+            try: 
+                choices.append(player.get_best_move(game))
+            except Exception as e: 
+                return f"lookahead {depth} game {seed} piece {piece}: {type(e).__name__}: {e}"
+        if(choices[0] != choices[1]): 
+            return f"lookahead {depth} game {seed} piece {piece}: reference {choices[0]}, Board {choices[1]}"
+        
+        move, swap_hold = choices[0]
+        if(not move): 
+            break
+        for game, player in games: 
+            game.step(move, swap_hold)
+        if(game_state(games[0][0]) != game_state(games[1][0])): 
+            return f"lookahead {depth} game {seed} piece {piece}: states differ after step({move}, {swap_hold})"
+        if(games[0][0].game_over): 
+            break
+    return None
+
+
+# --------------------------SHRINKING--------------------------
+
+def shrink(check, grid, pk): 
+    # removes whole rows, then single cells, for as long as the check keeps failing (greedy delta debugging)
+    grid = [row[:] for row in grid]
+    changed = True
+    while(changed): 
+        changed = False
+        for y in range(len(grid)): 
+            if(any(grid[y])): 
+                row = grid[y]
+                grid[y] = [0] * len(row)
+                if(check(grid, pk) is None): 
+                    grid[y] = row
+                else: 
+                    changed = True
+        for y in range(len(grid)): 
+            for x in range(len(grid[y])): 
+                if(grid[y][x]): 
+                    grid[y][x] = 0
+                    if(check(grid, pk) is None): 
+                        grid[y][x] = 1
+                    else: 
+                        changed = True
+    return grid
+
+def print_repro(name, description, check, grid, pk): 
+    minimal = shrink(check, grid, pk)
+    print(f"MISMATCH [{name}] piece {pk!r}: {description}")
+    print(f"minimal repro ({sum(map(sum, minimal))} cells): {check(minimal, pk)}")
+    for row in minimal: 
+        if(any(row)): 
+            print("    " + "".join("#" if cell else "." for cell in row))
+    print(f"    grid = {minimal}")
+
+
+# --------------------------RUNNING--------------------------
+
+def main(): 
+    parser = argparse.ArgumentParser(description="checks every fast engine/evaluator path against the reference implementation")
+    parser.add_argument("--boards", type=int, default=BOARDS, help="generated boards to check")
+    parser.add_argument("--games", type=int, default=GAMES, help="seeded games to step through")
+    parser.add_argument("--pieces", type=int, default=GAME_PIECES, help="pieces per game")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the boards and games")
+    parser.add_argument("--checks", nargs="+", choices=sorted(BOARD_CHECKS), help="board checks to run (default: all)")
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    mismatches = 0
+    
+    print(f"stepping {args.games} games...", flush = True)
+    snapshots = []
+    for game in range(args.games): 
+        failure = run_game(args.seed * 1000 + game, args.pieces, snapshots)
+        if(failure is not None): 
+            description, grid, pk, check = failure
+            print_repro("step", description, check, grid, pk)
+            mismatches += 1
+    
+    print(f"lookahead depths 1-{PIECE_PREVIEW_AMOUNT}...", flush = True)
+    for depth in range(1, PIECE_PREVIEW_AMOUNT + 1): 
+        failure = run_lookahead(args.seed * 1000 + depth, LOOKAHEAD_PIECES, depth)
+        if(failure is not None): 
+            print(f"MISMATCH [lookahead] {failure}")
+            mismatches += 1
+    
+    boards = generate_boards(args.boards, rng) + snapshots
+    for name in (args.checks or BOARD_CHECKS): 
+        check = BOARD_CHECKS[name]
+        cases = 0
+        print(f"{name}: ", end = "", flush = True)
+        for board_name, grid in boards: 
+            for pk in SHAPES: 
+                cases += 1
+                description = check(grid, pk)
+                if(description is not None): 
+                    print()
+                    print_repro(name, f"{board_name}: {description}", check, grid, pk)
+                    mismatches += 1
+                    break # one repro per board is plenty
+        print(f"{cases} cases")
+    
+    if(mismatches): 
+        print(f"{mismatches} mismatch(es)")
+        sys.exit(1)
+    print(f"All paths match the reference ({len(boards)} boards{', numpy batch evaluator included' if np is not None else ''}).")
+
+
+if __name__ == "__main__":
+    main()
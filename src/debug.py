@@ -0,0 +1,44 @@
+from tetris_engine import Board, MoveScanner
+
+# T-spin debugging
+# 37 moves, 3 t-spins (2 normal, 1 mini)
+T_SPIN_DEBUG_BOARD = [
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 1, 1, 0, 0],
+    [0, 0, 0, 1, 0, 0, 0, 1, 1, 0],
+    [1, 1, 1, 1, 1, 0, 1, 1, 1, 1]
+]
+
+
+class BoardOnly: 
+    # MoveScanner wants something with a .board (normally a TetrisGame)
+    def __init__(self, board): 
+        self.board = board
+  
+def debug(): 
+    board = Board()
+    board.board = T_SPIN_DEBUG_BOARD
+    
+    scanner = MoveScanner()
+    moves = scanner.get_all_legal_moves(BoardOnly(board), 'T')
+    print(len(moves))
+    print(f"t-spins: {sum(1 for move in moves if move[4] == 2)}, minis: {sum(1 for move in moves if move[4] == 1)}")
+
+if __name__ == "__main__": 
+    debug()
@@ -1,29 +1,26 @@
-import time
 import datetime
 import os
 from tetris_engine import TetrisGame
 from ai_player import GeneticPlayer
+from vector_env import play_games_lockstep
+from renderer import TerminalRenderer, ThreadedRenderer
+from replay import ReplayRecorder
 import json
+import random
 
 STATS_MODE = False # Stats mode makes it output only the final score, useful for statistics
 GAMES_TO_RUN = 1
+LOCKSTEP_TOGGLE = False # in stats mode, plays all GAMES_TO_RUN games together (numpy batch scoring)
 
-def print_board(game):
-    # clear screen
-    os.system('cls' if os.name == 'nt' else 'clear')
-    
-    print(f"Score: {game.score}")
-    print("+" + "-" * (game.board.width * 2) + "+")
-    
-    for row in game.board.board:
-        line = "|"
-        for cell in row:
-            # [] = blocks, . = empty space
-            line += "[]" if cell else " ."
-        line += "|"
-        print(line)
-        
-    print("+" + "-" * (game.board.width * 2) + "+")
+# rendering (when not in stats mode)
+RENDER_FPS = 2 # frames per second (0 = as fast as the AI plays)
+RENDER_FRAME_SKIP = 1 # draw every Nth piece
+RENDER_REALTIME = False # draws at RENDER_FPS on its own thread while the AI plays ahead without waiting
+
+# replays (seed + moves, play them back with: python replay.py replays/<file>)
+RECORD_REPLAYS_TOGGLE = False
+REPLAY_COMPRESSION_TOGGLE = True
+REPLAY_FOLDER = "replays"
 
 def main():
     # loading brain (from trainer.py)
@@ -48,13 +45,33 @@ def main():
         
     player = GeneticPlayer(weights)
     
+    if(STATS_MODE and LOCKSTEP_TOGGLE): 
+        # every game at once, scores come out in game order at the end
+        for score, total_moves in play_games_lockstep([weights] * GAMES_TO_RUN, [None] * GAMES_TO_RUN): 
+            print(f"{score}")
+        return
+    
     # play the game(s)
     for i in range(GAMES_TO_RUN): 
-        game = TetrisGame()
+        recorder = None
+        if(RECORD_REPLAYS_TOGGLE): 
+            # replays need a seeded game
+            seed = random.randrange(2**32)
+            game = TetrisGame(seed)
+            os.makedirs(REPLAY_FOLDER, exist_ok=True)
+            replay_path = os.path.join(REPLAY_FOLDER, f"game_{datetime.datetime.now():%Y%m%d_%H%M%S}_{seed}.tdr")
+            recorder = ReplayRecorder(replay_path, seed, REPLAY_COMPRESSION_TOGGLE)
+        else: 
+            game = TetrisGame()
         
         total_moves = 0
         start_time = datetime.datetime.now()
         
+        renderer = None
+        if(not STATS_MODE): 
+            renderer_class = ThreadedRenderer if RENDER_REALTIME else TerminalRenderer
+            renderer = renderer_class(RENDER_FPS, RENDER_FRAME_SKIP)
+        
         # game loop
         while not game.game_over:
             move, swap_hold = player.get_best_move(game)
@@ -65,20 +82,26 @@ def main():
             # executes moves
             game.step(move, swap_hold)
             
+            if(recorder is not None): 
+                recorder.record(move, swap_hold)
+            
             # turn off stats mode to see it play
-            if(not STATS_MODE): 
-                if(swap_hold): 
-                    print('swapped hold')
-                print_board(game)
-                time.sleep(0.5)
+            if(renderer is not None): 
+                renderer.render(game, swap_hold)
 
+        if(recorder is not None): 
+            recorder.close()
+        
         if(STATS_MODE):
             print(f"{game.score}") 
-            # print_board(game) # for examining final board states
+            # TerminalRenderer().close(game) # for examining final board states
         else: 
+            renderer.close(game)
             print(f"Final Score: {game.score}")
             print(f"Total Moves: {total_moves}")
             print(f"Time Elapsed: {datetime.datetime.now() - start_time}")
+            if(recorder is not None): 
+                print(f"Saved replay to {replay_path}")
         
         
 
@@ -0,0 +1,150 @@
+import json
+import os
+import statistics
+import time
+
+# Training metrics sink for watching long trainer.py runs from outside
+# after every scored genome it appends a JSON line (buffered, flushed once a generation) and rewrites a
+# Prometheus textfile (temp file + rename, so a scraper never sees half a file) for node exporter's textfile collector
+# MetricsSink does the work, NullMetrics has the same methods but does nothing (the trainer holds NULL_METRICS by default)
+
+METRIC_PREFIX = "tetris_training_"
+JSONL_BUFFER_SIZE = 1 << 16
+
+# name -> (type, help)
+METRICS = {
+    "generation": ("gauge", "Generation being trained (1-based)"),
+    "moves_limit": ("gauge", "Moves limit of the current generation"),
+    "moves_limit_changes_total": ("counter", "Times the moves limit was changed"),
+    "genomes_scored_total": ("counter", "Genomes that finished their games (once each, genomes dropped by racing included)"),
+    "pieces_total": ("counter", "Pieces placed in played games (fitness cache hits not included)"),
+    "pieces_per_second": ("gauge", "Pieces placed per second of wall time in the current generation"),
+    "generation_best_score": ("gauge", "Best fitness in the current generation so far (full moves budget only)"),
+    "generation_median_score": ("gauge", "Median fitness in the current generation so far (full moves budget only)"),
+    "generation_worst_score": ("gauge", "Worst fitness in the current generation so far (full moves budget only)"),
+    "best_score": ("gauge", "Best fitness of the whole run"),
+    "phase_seconds_total": ("counter", "Wall time per trainer phase (games includes waiting on worker processes)"),
+    "last_update_timestamp_seconds": ("gauge", "Unix time of the last update (a stalled run stops moving this)")
+}
+
+
+class MetricsSink: 
+    enabled = True
+    
+    def __init__(self, prometheus_path, jsonl_path): 
+        self.prometheus_path = prometheus_path
+        self.jsonl = open(jsonl_path, "a", buffering=JSONL_BUFFER_SIZE)
+        self.values = {name: 0 for name in METRICS if name != "phase_seconds_total"}
+        self.phase_seconds = {} # phase -> wall seconds
+        self.generation_scores = []
+        self.generation_pieces = 0
+        self.generation_start = time.perf_counter()
+    
+    def start(self): 
+        # wall time, CPU time of the trainer process would miss games played in worker processes
+        return time.perf_counter()
+    
+    def stop(self, phase, start): 
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + time.perf_counter() - start
+    
+    def start_generation(self, generation, moves_limit): 
+        self.values["generation"] = generation + 1
+        self.values["moves_limit"] = moves_limit
+        self.generation_scores = []
+        self.generation_pieces = 0
+        self.generation_start = time.perf_counter()
+        self.write_textfile()
+    
+    def genome_scored(self, genome, score, moves, pieces, rung=0, full_budget=True): 
+        # one genome finished its games (pieces = pieces placed in games that were really played, not cached, over every rung)
+        # genomes dropped by racing (full_budget=False) count, but their short budget scores stay out of the score gauges
+        if(full_budget): 
+            self.generation_scores.append(score)
+        self.generation_pieces += pieces
+        self.values["genomes_scored_total"] += 1
+        self.values["pieces_total"] += pieces
+        
+        elapsed = time.perf_counter() - self.generation_start
+        self.values["pieces_per_second"] = self.generation_pieces / elapsed if elapsed else 0.0
+        if(self.generation_scores): 
+            self.values["generation_best_score"] = max(self.generation_scores)
+            self.values["generation_median_score"] = statistics.median(self.generation_scores)
+            self.values["generation_worst_score"] = min(self.generation_scores)
+        
+        self.write_line({"event": "genome", "generation": self.values["generation"], "genome": genome, "rung": rung,
+                         "full_budget": full_budget, "score": score, "moves": moves, "pieces": pieces})
+        self.write_textfile()
+    
+    def moves_limit_changed(self, old_limit, new_limit): 
+        self.values["moves_limit_changes_total"] += 1
+        self.write_line({"event": "moves_limit", "generation": self.values["generation"], "old": old_limit, "new": new_limit})
+    
+    def end_generation(self, scores, best_score): 
+        # scores: fitness of the whole population, best_score: best of the run so far
+        self.values["best_score"] = best_score
+        if(scores): 
+            self.values["generation_best_score"] = max(scores)
+            self.values["generation_median_score"] = statistics.median(scores)
+            self.values["generation_worst_score"] = min(scores)
+        
+        self.write_line({"event": "generation", "generation": self.values["generation"], "moves_limit": self.values["moves_limit"],
+                         "best": self.values["generation_best_score"], "median": self.values["generation_median_score"],
+                         "worst": self.values["generation_worst_score"], "pieces": self.generation_pieces,
+                         "pieces_per_second": self.values["pieces_per_second"], "phase_seconds": dict(self.phase_seconds)})
+        self.jsonl.flush()
+        self.write_textfile()
+    
+    def write_line(self, record): 
+        record["time"] = time.time()
+        self.jsonl.write(json.dumps(record) + "\n")
+    
+    def write_textfile(self): 
+        self.values["last_update_timestamp_seconds"] = time.time()
+        lines = []
+        for name, (metric_type, description) in METRICS.items(): 
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {description}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {metric_type}")
+            if(name == "phase_seconds_total"): 
+                for phase, seconds in sorted(self.phase_seconds.items()): 
+                    lines.append(f'{METRIC_PREFIX}{name}{{phase="{phase}"}} {seconds}')
+            else: 
+                lines.append(f"{METRIC_PREFIX}{name} {self.values[name]}")
+        
+        # write to a temp file first so the scraper never reads a half written file
+        temp_path = self.prometheus_path + ".tmp"
+        with open(temp_path, "w") as w: 
+            w.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.prometheus_path)
+    
+    def close(self): 
+        self.write_textfile()
+        self.jsonl.close()
+
+
+
+class NullMetrics: 
+    enabled = False
+    
+    def start(self): 
+        return 0
+    
+    def stop(self, phase, start): 
+        pass
+    
+    def start_generation(self, generation, moves_limit): 
+        pass
+    
+    def genome_scored(self, genome, score, moves, pieces, rung=0, full_budget=True): 
+        pass
+    
+    def moves_limit_changed(self, old_limit, new_limit): 
+        pass
+    
+    def end_generation(self, scores, best_score): 
+        pass
+    
+    def close(self): 
+        pass
+
+
+NULL_METRICS = NullMetrics()
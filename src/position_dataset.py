@@ -0,0 +1,253 @@
+from tetris_engine import TetrisGame
+from ai_player import GeneticPlayer, BoardEvaluator, compile_weights, HEIGHT_PENALTY_INDEX, np
+from replay import pack_move, unpack_move, PIECE_KEYS
+from settings import MATRIX_HEIGHT, PIECE_PREVIEW_AMOUNT
+import argparse
+import json
+import mmap
+import struct
+import time
+
+# Position dataset: positions from seeded games with every legal candidate move and its feature vector
+# (BoardEvaluator.placement_features) worked out ahead of time, plus the move a deep lookahead oracle picked
+# scoring a genome on it is one dot product per candidate (no move generation, no games), so the trainer
+# can use it as a cheap surrogate fitness to screen genomes before they play full games
+#
+# file layout (little endian):
+#   header: magic, version, board height, preview amount, position count, candidate count, position table offset (see HEADER)
+#   candidates: one record per candidate move, grouped by position (see CANDIDATE)
+#       packed move (replay.pack_move, hold flag = the move is for the held piece), the 5 FEATURE_KEYS stats, height penalty
+#   position table: one record per position (see position_struct)
+#       board rows (bitmasks, top row first), current piece, held piece, preview pieces, oracle candidate index,
+#       first candidate, candidate count
+# every record is fixed size, so the file gets memory mapped and positions are read straight out of it
+
+MAGIC = b"TDPS"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBIQQ")
+CANDIDATE = struct.Struct("<3s5hd")
+NO_PIECE = 7 # held piece index when nothing is held
+
+# recording defaults
+DATASET_PATH = "positions.tdps"
+DATASET_GAMES = 20
+DATASET_PIECES = 200 # pieces per game
+ORACLE_DEPTH = 2 # lookahead of the oracle (capped by PIECE_PREVIEW_AMOUNT)
+ORACLE_BEAM_WIDTH = 8
+
+
+def position_struct(height, preview): 
+    return struct.Struct(f"<{height}H{2 + preview}BHIH")
+
+
+def piece_index(piece_key): 
+    return NO_PIECE if piece_key is None else PIECE_KEYS.index(piece_key)
+
+
+def piece_key(index): 
+    return None if index == NO_PIECE else PIECE_KEYS[index]
+
+
+
+class DatasetRecorder: 
+    # candidates stream to disk as positions come in, the (small) position table gets written by close()
+    def __init__(self, path, height=MATRIX_HEIGHT, preview=PIECE_PREVIEW_AMOUNT): 
+        self.file = open(path, "wb")
+        self.height = height
+        self.preview = preview
+        self.position_struct = position_struct(height, preview)
+        self.positions = []
+        self.candidate_count = 0
+        self.file.write(self.header(0)) # counts and the table offset get filled in by close()
+    
+    def header(self, table_offset): 
+        return HEADER.pack(MAGIC, VERSION, self.height, self.preview, len(self.positions), self.candidate_count, table_offset)
+    
+    def record(self, rows, current_piece_key, held_piece_key, preview, candidates, oracle_index): 
+        # candidates: [(move, swap_hold, feature vector)]
+        for move, swap_hold, features in candidates: 
+            self.file.write(CANDIDATE.pack(pack_move(move, swap_hold), *features))
+        pieces = [piece_index(current_piece_key), piece_index(held_piece_key)] + [piece_index(pk) for pk in preview]
+        self.positions.append(self.position_struct.pack(*rows, *pieces, oracle_index, self.candidate_count, len(candidates)))
+        self.candidate_count += len(candidates)
+    
+    def close(self): 
+        table_offset = self.file.tell()
+        self.file.write(b"".join(self.positions))
+        self.file.seek(0)
+        self.file.write(self.header(table_offset))
+        self.file.close()
+    
+    def __enter__(self): 
+        return self
+    
+    def __exit__(self, *exc): 
+        self.close()
+
+
+
+class PositionDataset: 
+    def __init__(self, path): 
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.height, self.preview, self.position_count, self.candidate_count, self.table_offset = HEADER.unpack_from(self.data, 0)
+        if(magic != MAGIC): 
+            raise ValueError(f"{path} is not a position dataset")
+        if(version != VERSION): 
+            raise ValueError(f"{path} is dataset version {version}, this reader supports version {VERSION}")
+        
+        self.position_struct = position_struct(self.height, self.preview)
+        self.evaluator = BoardEvaluator()
+        self.arrays = None # numpy views of the whole file, made on the first numpy agreement() call
+    
+    def __len__(self): 
+        return self.position_count
+    
+    def position(self, index): 
+        # (board rows, current piece, held piece, preview, oracle candidate index, first candidate, candidate count)
+        if(not 0 <= index < self.position_count): 
+            raise IndexError(f"position {index} out of range (dataset has {self.position_count} positions)")
+        fields = self.position_struct.unpack_from(self.data, self.table_offset + index * self.position_struct.size)
+        rows = list(fields[:self.height])
+        pieces = [piece_key(i) for i in fields[self.height:self.height + 2 + self.preview]]
+        oracle_index, first, count = fields[-3:]
+        return rows, pieces[0], pieces[1], pieces[2:], oracle_index, first, count
+    
+    def candidates(self, index): 
+        # [(move, swap_hold, feature vector)] of one position, in the order GeneticPlayer looks at them
+        rows, current, held, preview, oracle_index, first, count = self.position(index)
+        start = HEADER.size + first * CANDIDATE.size
+        candidates = []
+        for packed, *features in CANDIDATE.iter_unpack(self.data[start:start + count * CANDIDATE.size]): 
+            move, swap_hold = unpack_move(packed)
+            candidates.append((move, swap_hold, tuple(features)))
+        return candidates
+    
+    def agreement(self, genomes): 
+        # share of positions where each genome would pick the oracle's move (ties go to the first candidate, like GeneticPlayer)
+        compiled = [compile_weights(genome) for genome in genomes]
+        if(not self.position_count): 
+            return [0.0] * len(compiled)
+        if(np is None): 
+            return self._agreement_python(compiled)
+        
+        features, starts, oracles = self._numpy_arrays()
+        scores = self.evaluator.score_matrix(features, compiled, as_array=True) # (candidates, genomes)
+        
+        # a genome agrees if the oracle's candidate scores the position's max and no earlier candidate does
+        best = np.maximum.reduceat(scores, starts, axis=0)
+        counts = np.diff(np.append(starts, len(scores)))
+        is_best = scores == np.repeat(best, counts, axis=0)
+        best_before = np.vstack([np.zeros((1, len(compiled)), dtype=int), np.cumsum(is_best, axis=0)])
+        agrees = is_best[oracles] & (best_before[oracles] == best_before[starts])
+        return (agrees.sum(axis=0) / self.position_count).tolist()
+    
+    def _agreement_python(self, compiled): 
+        hits = [0] * len(compiled)
+        for index in range(self.position_count): 
+            oracle_index = self.position(index)[4]
+            scores = self.evaluator.score_matrix([features for move, swap_hold, features in self.candidates(index)], compiled)
+            for g in range(len(compiled)): 
+                column = [row[g] for row in scores]
+                if(column.index(max(column)) == oracle_index): 
+                    hits[g] += 1
+        return [hit / self.position_count for hit in hits]
+    
+    def _numpy_arrays(self): 
+        # (every candidate's feature vector, first candidate of every position, oracle candidate of every position)
+        if(self.arrays is None): 
+            candidate_type = np.dtype([("move", "V3"), ("stats", "<i2", (HEIGHT_PENALTY_INDEX,)), ("penalty", "<f8")])
+            records = np.frombuffer(self.data, candidate_type, self.candidate_count, HEADER.size)
+            features = np.column_stack([records["stats"].astype(float), records["penalty"]])
+            
+            table = np.frombuffer(self.data, np.uint8, self.position_count * self.position_struct.size, self.table_offset)
+            table = table.reshape(self.position_count, self.position_struct.size)
+            tail = self.position_struct.size - 8 # oracle index (2 bytes), first candidate (4), candidate count (2)
+            oracle_index = table[:, tail:tail + 2].copy().view("<u2")[:, 0]
+            starts = table[:, tail + 2:tail + 6].copy().view("<u4")[:, 0].astype(np.int64)
+            self.arrays = (features, starts, starts + oracle_index)
+        return self.arrays
+    
+    def close(self): 
+        self.arrays = None
+        self.data.close()
+        self.file.close()
+    
+    def __enter__(self): 
+        return self
+    
+    def __exit__(self, *exc): 
+        self.close()
+
+
+def record_dataset(path, weights, seeds, pieces=DATASET_PIECES, oracle_depth=ORACLE_DEPTH, beam_width=ORACLE_BEAM_WIDTH, log=print): 
+    # plays every seed with the oracle (weights + beam search lookahead) and records every position it sees
+    oracle = GeneticPlayer(weights, lookahead_depth=oracle_depth, beam_width=beam_width)
+    with DatasetRecorder(path) as recorder: 
+        for seed in seeds: 
+            game = TetrisGame(seed)
+            for _ in range(pieces): 
+                if(game.game_over): 
+                    break
+                
+                # features come from a copy, scoring pieces poking out the top changes the board it's done on
+                board = game.board.copy()
+                moves, extra_moves = oracle.get_candidate_moves(game)
+                candidates = [(move, False) for move in moves] + [(move, True) for move in extra_moves]
+                
+                current_move, swap_hold = oracle.get_best_move(game)
+                if(not current_move): 
+                    break # oracle gave up
+                oracle_index = candidates.index((current_move, swap_hold))
+                
+                candidates = [(move, swap, oracle.evaluator.placement_features(board, move)) for move, swap in candidates]
+                recorder.record(game.board.rows, game.current_piece_key, game.held_piece_key, game.get_piece_preview(), candidates, oracle_index)
+                game.step(current_move, swap_hold)
+            log(".", end = "", flush = True)
+        log()
+        return len(recorder.positions), recorder.candidate_count
+
+
+def load_weights(path): 
+    # brain files are [score, weights] (same as best_brain.json)
+    with open(path, "r") as r: 
+        score, weights = json.load(r)
+    return weights
+
+
+def main(): 
+    parser = argparse.ArgumentParser(description="records and scores offline position datasets (surrogate fitness for trainer.py)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    record = commands.add_parser("record", help="play seeded games with a lookahead oracle and record every position")
+    record.add_argument("path", nargs="?", default=DATASET_PATH, help="dataset file to write")
+    record.add_argument("--brain", default="brains/best_brain.json", help="weights the oracle plays with")
+    record.add_argument("--games", type=int, default=DATASET_GAMES, help="seeded games to record")
+    record.add_argument("--pieces", type=int, default=DATASET_PIECES, help="pieces per game")
+    record.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    record.add_argument("--oracle-depth", type=int, default=ORACLE_DEPTH, help="oracle lookahead (preview pieces)")
+    
+    score = commands.add_parser("score", help="how often brains pick the oracle's move")
+    score.add_argument("path", nargs="?", default=DATASET_PATH, help="dataset file to read")
+    score.add_argument("brains", nargs="+", help="brain files")
+    args = parser.parse_args()
+    
+    if(args.command == "record"): 
+        print(f"recording {args.games} games (oracle lookahead {args.oracle_depth})...")
+        start = time.perf_counter()
+        positions, candidates = record_dataset(args.path, load_weights(args.brain), range(args.seed, args.seed + args.games), args.pieces, args.oracle_depth)
+        print(f"Saved {positions} positions ({candidates} candidates) to {args.path}")
+        print(f"Time Elapsed: {time.perf_counter() - start:.1f}s")
+        return
+    
+    with PositionDataset(args.path) as dataset: 
+        start = time.perf_counter()
+        agreement = dataset.agreement([load_weights(path) for path in args.brains])
+        elapsed = time.perf_counter() - start
+        for path, share in zip(args.brains, agreement): 
+            print(f"{path}: {share:.1%} agreement with the oracle")
+        print(f"{len(dataset)} positions, {elapsed * 1000 / len(args.brains):.1f}ms per brain")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import time
+
+# Per-phase timers and counters for the player/trainer
+# Profiler does the actual timing, NullProfiler has the same methods but does nothing
+# (everything holds a NULL_PROFILER by default, so turning profiling off costs a couple of no-op calls per move)
+
+SCAN_COUNTERS = ("bfs_nodes", "kick_tests", "moves_scored") # counters shown per move generation call
+
+
+class Profiler: 
+    enabled = True
+    
+    def __init__(self): 
+        self.timers = {} # name -> [total seconds, calls]
+        self.counters = {} # name -> count
+    
+    def start(self): 
+        return time.perf_counter()
+    
+    def stop(self, name, start): 
+        elapsed = time.perf_counter() - start
+        timer = self.timers.get(name)
+        if(timer is None): 
+            self.timers[name] = [elapsed, 1]
+        else: 
+            timer[0] += elapsed
+            timer[1] += 1
+    
+    def count(self, name, amount=1): 
+        self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def snapshot(self): 
+        # plain dict version (JSON friendly, can be sent back from worker processes)
+        return {
+            "timers": {name: {"seconds": timer[0], "calls": timer[1]} for name, timer in self.timers.items()},
+            "counters": dict(self.counters)
+        }
+    
+    def merge(self, snapshot): 
+        # adds another profiler's snapshot into this one (games -> generation -> whole run)
+        for name, timer in snapshot["timers"].items(): 
+            total = self.timers.setdefault(name, [0.0, 0])
+            total[0] += timer["seconds"]
+            total[1] += timer["calls"]
+        for name, amount in snapshot["counters"].items(): 
+            self.count(name, amount)
+    
+    def reset(self): 
+        self.timers = {}
+        self.counters = {}
+    
+    def summary_table(self, total_timer="game"): 
+        # one line per timer (with % of total_timer) and then the counters
+        total_seconds = self.timers[total_timer][0] if total_timer in self.timers else 0
+        lines = [f"{'phase':<20}{'calls':>10}{'total (s)':>12}{'avg (ms)':>12}{'% time':>9}"]
+        for name, (seconds, calls) in sorted(self.timers.items(), key=lambda item: -item[1][0]): 
+            percent = f"{seconds / total_seconds:.1%}" if total_seconds else "-"
+            lines.append(f"{name:<20}{calls:>10}{seconds:>12.3f}{seconds / calls * 1000:>12.3f}{percent:>9}")
+        
+        move_calls = self.timers["move_generation"][1] if "move_generation" in self.timers else 0
+        for name, amount in sorted(self.counters.items()): 
+            per_call = f"  ({amount / move_calls:.1f} per scan)" if move_calls and name in SCAN_COUNTERS else ""
+            lines.append(f"{name:<20}{amount:>10}{per_call}")
+        return "\n".join(lines)
+
+
+
+class NullProfiler: 
+    enabled = False
+    
+    def start(self): 
+        return 0
+    
+    def stop(self, name, start): 
+        pass
+    
+    def count(self, name, amount=1): 
+        pass
+    
+    def snapshot(self): 
+        return None
+    
+    def merge(self, snapshot): 
+        pass
+    
+    def reset(self): 
+        pass
+    
+    def summary_table(self, total_timer="game"): 
+        return "profiling is off"
+
+
+NULL_PROFILER = NullProfiler()
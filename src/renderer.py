@@ -0,0 +1,129 @@
+import os
+import sys
+import threading
+import time
+
+# Terminal renderer for watching the AI play
+# the first frame draws everything, after that only the cells that changed get redrawn (ANSI cursor moves),
+# and every frame goes out in one write (no clearing the screen, no shell calls)
+# ThreadedRenderer draws on its own thread at the target FPS, so the game never waits on the terminal
+
+ESC = "\x1b["
+BLOCK = "[]"
+EMPTY = " ."
+BOARD_TOP = 3 # terminal row of the top matrix row (1-based, after the status line and the border)
+
+
+def snapshot(game, swap_hold=False): 
+    # everything a frame needs, copied so the game can keep going while it gets drawn
+    return (list(game.board.rows), game.board.width, game.score, swap_hold)
+
+
+class TerminalRenderer: 
+    def __init__(self, fps=2, frame_skip=1, stream=None): 
+        self.fps = fps # 0 = no frame limit
+        self.frame_skip = frame_skip # draw every Nth piece
+        self.stream = stream or sys.stdout
+        self.pieces = 0
+        self.last_rows = None
+        self.last_status = None
+        self.next_frame_time = 0
+        
+        if(os.name == 'nt'): 
+            os.system('') # turns on ANSI escape codes in the Windows console (once, not per frame)
+    
+    def render(self, game, swap_hold=False): 
+        # call once per piece, draws if it's this piece's turn (and waits for the frame time if there's an FPS limit)
+        self.pieces += 1
+        if(self.pieces % self.frame_skip != 0): 
+            return
+        self.wait_for_frame()
+        self.draw(snapshot(game, swap_hold))
+    
+    def wait_for_frame(self): 
+        if(not self.fps): 
+            return
+        now = time.perf_counter()
+        if(now < self.next_frame_time): 
+            time.sleep(self.next_frame_time - now)
+        self.next_frame_time = max(now, self.next_frame_time) + 1 / self.fps
+    
+    def draw(self, frame): 
+        rows, width, score, swap_hold = frame
+        out = []
+        
+        if(self.last_rows is None or len(self.last_rows) != len(rows)): 
+            # full frame: clear once, hide the cursor and draw the border
+            out.append(ESC + "2J" + ESC + "?25l")
+            border = "+" + "-" * (width * 2) + "+"
+            out.append(f"{ESC}2;1H{border}")
+            for y in range(len(rows)): 
+                out.append(f"{ESC}{BOARD_TOP + y};1H|{ESC}{BOARD_TOP + y};{width * 2 + 2}H|")
+            out.append(f"{ESC}{BOARD_TOP + len(rows)};1H{border}")
+            self.last_rows = [~row for row in rows] # every cell counts as changed
+            self.last_status = None
+        
+        status = f"Score: {score}" + ("  (swapped hold)" if swap_hold else "")
+        if(status != self.last_status): 
+            out.append(f"{ESC}1;1H{status}{ESC}K")
+            self.last_status = status
+        
+        for y, (row, last_row) in enumerate(zip(rows, self.last_rows)): 
+            changed = row ^ last_row
+            if(not changed): 
+                continue
+            for x in range(width): 
+                if(changed >> x & 1): 
+                    out.append(f"{ESC}{BOARD_TOP + y};{x * 2 + 2}H{BLOCK if row >> x & 1 else EMPTY}")
+        self.last_rows = rows
+        
+        # park the cursor under the board
+        out.append(f"{ESC}{BOARD_TOP + len(rows) + 1};1H")
+        self.stream.write("".join(out))
+        self.stream.flush()
+    
+    def close(self, game=None): 
+        # draws the final board (even if frame skipping would have skipped it) and shows the cursor again
+        if(game is not None): 
+            self.draw(snapshot(game))
+        self.stream.write(ESC + "?25h")
+        self.stream.flush()
+
+
+
+class ThreadedRenderer(TerminalRenderer): 
+    # real time mode: render() only hands over the latest frame, a background thread draws at the target FPS
+    # the game runs ahead as fast as it can and frames in between get dropped
+    def __init__(self, fps=30, frame_skip=1, stream=None): 
+        super().__init__(fps, frame_skip, stream)
+        self.latest_frame = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.draw_loop, daemon=True)
+        self.thread.start()
+    
+    def render(self, game, swap_hold=False): 
+        self.pieces += 1
+        if(self.pieces % self.frame_skip != 0): 
+            return
+        frame = snapshot(game, swap_hold)
+        with self.lock: 
+            self.latest_frame = frame
+    
+    def take_frame(self): 
+        with self.lock: 
+            frame = self.latest_frame
+            self.latest_frame = None
+        return frame
+    
+    def draw_loop(self): 
+        while(not self.stopping.is_set()): 
+            frame = self.take_frame()
+            if(frame is not None): 
+                self.draw(frame)
+            self.stopping.wait(1 / self.fps if self.fps else 0.001)
+    
+    def close(self, game=None): 
+        self.stopping.set()
+        self.thread.join()
+        super().close(game)
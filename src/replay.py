@@ -0,0 +1,180 @@
+from tetris_engine import TetrisGame
+from renderer import TerminalRenderer
+import argparse
+import mmap
+import struct
+import time
+import zlib
+
+# Binary replays: the game seed plus every step() call (move tuple + hold flag), so a game can be replayed
+# straight through TetrisGame.step without the AI (no MoveScanner, no BoardEvaluator)
+#
+# file layout (little endian):
+#   header: magic, version, flags, seed, move count, moves per chunk, chunk index offset (see HEADER)
+#   moves: 3 bytes each (see pack_move), either stored plainly or in zlib compressed chunks of CHUNK_MOVES moves
+#   chunk index (compressed files only): chunk count, then the file offset of every chunk
+# plain files are fixed size per move, so any move can be read straight out of the memory map;
+# compressed files only need to decompress the one chunk the move is in
+
+MAGIC = b"TDRP"
+VERSION = 1
+HEADER = struct.Struct("<4sBBQIHQ")
+FLAG_COMPRESSED = 1
+CHUNK_MOVES = 4096
+MOVE_SIZE = 3
+
+PIECE_KEYS = "IJLOSTZ" # piece key <-> 3 bit index (fixed, so old replays keep working if SHAPES changes order)
+COORD_OFFSET = 4 # x and y can go a bit negative (piece boxes hang off the matrix)
+
+
+def pack_move(move, swap_hold): 
+    # x: 5 bits, y: 5 bits, r: 2 bits, piece: 3 bits, T-spin: 2 bits, hold: 1 bit
+    x, y, r, piece_key, T_spin = move
+    packed = (x + COORD_OFFSET) | (y + COORD_OFFSET) << 5 | r << 10 | PIECE_KEYS.index(piece_key) << 12 | T_spin << 15 | swap_hold << 17
+    return packed.to_bytes(MOVE_SIZE, "little")
+
+
+def unpack_move(data, offset=0): 
+    packed = int.from_bytes(data[offset:offset + MOVE_SIZE], "little")
+    move = ((packed & 31) - COORD_OFFSET, (packed >> 5 & 31) - COORD_OFFSET, packed >> 10 & 3, PIECE_KEYS[packed >> 12 & 7], packed >> 15 & 3)
+    return move, bool(packed >> 17 & 1)
+
+
+
+class ReplayRecorder: 
+    # streams moves to disk as the game is played (compressed files write a chunk every CHUNK_MOVES moves)
+    def __init__(self, path, seed, compress=False): 
+        if(seed is None): 
+            raise ValueError("replays need a seeded game (TetrisGame(seed))")
+        self.file = open(path, "wb")
+        self.seed = seed
+        self.compress = compress
+        self.move_count = 0
+        self.buffer = bytearray()
+        self.chunk_offsets = []
+        self.file.write(self.header(0)) # move count and index offset get filled in by close()
+    
+    def header(self, index_offset): 
+        flags = FLAG_COMPRESSED if self.compress else 0
+        return HEADER.pack(MAGIC, VERSION, flags, self.seed, self.move_count, CHUNK_MOVES, index_offset)
+    
+    def record(self, move, swap_hold): 
+        self.buffer += pack_move(move, swap_hold)
+        self.move_count += 1
+        if(len(self.buffer) >= CHUNK_MOVES * MOVE_SIZE): 
+            self.flush_chunk()
+    
+    def flush_chunk(self): 
+        if(not self.buffer): 
+            return
+        if(self.compress): 
+            self.chunk_offsets.append(self.file.tell())
+            self.file.write(zlib.compress(bytes(self.buffer)))
+        else: 
+            self.file.write(self.buffer)
+        self.buffer = bytearray()
+    
+    def close(self): 
+        self.flush_chunk()
+        index_offset = 0
+        if(self.compress): 
+            index_offset = self.file.tell()
+            self.file.write(struct.pack(f"<I{len(self.chunk_offsets)}Q", len(self.chunk_offsets), *self.chunk_offsets))
+        self.file.seek(0)
+        self.file.write(self.header(index_offset))
+        self.file.close()
+    
+    def __enter__(self): 
+        return self
+    
+    def __exit__(self, *exc): 
+        self.close()
+
+
+
+class ReplayReader: 
+    # memory maps a replay file, moves can be read by piece index without loading the whole file
+    def __init__(self, path): 
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, self.seed, self.move_count, self.chunk_moves, index_offset = HEADER.unpack_from(self.data, 0)
+        if(magic != MAGIC): 
+            raise ValueError(f"{path} is not a replay file")
+        if(version != VERSION): 
+            raise ValueError(f"{path} is replay version {version}, this reader supports version {VERSION}")
+        
+        self.compressed = bool(flags & FLAG_COMPRESSED)
+        self.chunk_offsets = []
+        if(self.compressed): 
+            chunk_count, = struct.unpack_from("<I", self.data, index_offset)
+            self.chunk_offsets = list(struct.unpack_from(f"<{chunk_count}Q", self.data, index_offset + 4)) + [index_offset]
+        self.cached_chunk = (None, None) # (chunk index, decompressed bytes), reading in order only decompresses each chunk once
+    
+    def __len__(self): 
+        return self.move_count
+    
+    def chunk(self, index): 
+        if(self.cached_chunk[0] != index): 
+            start, end = self.chunk_offsets[index], self.chunk_offsets[index + 1]
+            self.cached_chunk = (index, zlib.decompress(self.data[start:end]))
+        return self.cached_chunk[1]
+    
+    def move(self, index): 
+        # (move tuple, swap_hold) of the index-th piece
+        if(not 0 <= index < self.move_count): 
+            raise IndexError(f"move {index} out of range (replay has {self.move_count} moves)")
+        if(self.compressed): 
+            chunk_index, position = divmod(index, self.chunk_moves)
+            return unpack_move(self.chunk(chunk_index), position * MOVE_SIZE)
+        return unpack_move(self.data, HEADER.size + index * MOVE_SIZE)
+    
+    def __iter__(self): 
+        for index in range(self.move_count): 
+            yield self.move(index)
+    
+    def close(self): 
+        self.data.close()
+        self.file.close()
+    
+    def __enter__(self): 
+        return self
+    
+    def __exit__(self, *exc): 
+        self.close()
+
+
+def replay_game(reader, pieces=None, renderer=None): 
+    # plays the first `pieces` moves (default: all of them) into a fresh game and returns it
+    game = TetrisGame(reader.seed)
+    for index in range(len(reader) if pieces is None else min(pieces, len(reader))): 
+        move, swap_hold = reader.move(index)
+        game.step(move, swap_hold)
+        if(renderer is not None): 
+            renderer.render(game, swap_hold)
+    return game
+
+
+def main(): 
+    parser = argparse.ArgumentParser(description="replays a recorded game without the AI")
+    parser.add_argument("path", help="replay file")
+    parser.add_argument("--pieces", type=int, help="stop after this many pieces (default: the whole game)")
+    parser.add_argument("--watch", type=int, metavar="FPS", help="draw the game in the terminal at this frame rate (0 = as fast as possible)")
+    args = parser.parse_args()
+    
+    with ReplayReader(args.path) as reader: 
+        print(f"seed {reader.seed}, {len(reader)} moves{' (compressed)' if reader.compressed else ''}")
+        renderer = TerminalRenderer(args.watch) if args.watch is not None else None
+        
+        start = time.perf_counter()
+        game = replay_game(reader, args.pieces, renderer)
+        elapsed = time.perf_counter() - start
+        
+        if(renderer is not None): 
+            renderer.close(game)
+        pieces = len(reader) if args.pieces is None else min(args.pieces, len(reader))
+        print(f"Final Score: {game.score}")
+        print(f"Pieces: {pieces} ({pieces / elapsed if elapsed else 0:,.0f} pieces/s)")
+
+
+if __name__ == "__main__":
+    main()
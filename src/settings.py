@@ -20,6 +20,10 @@ NORMAL_SPAWN_POSITION_Y = 0
 I_PIECE_SPAWN_POSITION_X = 2
 I_PIECE_SPAWN_POSITION_Y = -2
 
+MOVE_CACHE_SIZE = 2048 # max (board, piece) legal move lists the MoveScanner remembers (0 = off)
+MOVEMENT_MODEL = "srs" # how the MoveScanner moves pieces: "hard_drop", "soft_drop" or "srs" (see MoveScanner)
+DEDUPE_PLACEMENTS = True # MoveScanner drops placements that fill the same cells as an earlier one (O rotations, S/Z/I flips)
+
 
 
 # Guideline SRS Shapes
@@ -0,0 +1,137 @@
+from tetris_engine import Board, MoveScanner, SHAPES, can_spawn
+from debug import BoardOnly
+from profiler import Profiler
+from settings import MATRIX_HEIGHT, MATRIX_WIDTH
+import argparse
+import random
+import time
+
+# Adversarial stress boards: shapes seeded AI games rarely reach but that blow up the MoveScanner's BFS
+# (open boards with lots of room, tall ragged stacks, overhangs with space to tuck under, caves to kick into)
+# stress_boards() is the "stress" scenario source in benchmark.py, random_stress_board() feeds conformance.py
+#
+# every board keeps the top SPAWN_CLEARANCE rows empty so all pieces can still spawn (a blocked spawn scans nothing),
+# and no row is ever full (a real game would have cleared it, and every placement would count it as a cleared line)
+
+SPAWN_CLEARANCE = 4
+STRESS_SEED = 0
+STRESS_BOARDS_PER_PROFILE = 4
+SCAN_REPEATS = 3 # the CLI times every scan this many times and keeps the best
+
+# profile name -> stress_board() settings
+# the BFS visits every reachable free spot, so open boards are the worst case for scan size,
+# ledges and caves are the worst case for landing spots (moves to score) and kick tests
+STRESS_PROFILES = {
+    "open": {"stack_height": 1, "hole_density": 0.0},
+    "tall": {"stack_height": 14, "hole_density": 0.05},
+    "overhangs": {"stack_height": 2, "hole_density": 0.05, "overhangs": 6},
+    "caves": {"stack_height": 6, "hole_density": 0.05, "caves": 4},
+    "garbage": {"stack_height": 4, "hole_density": 0.1, "garbage_lines": 8},
+    "mixed": {"stack_height": 5, "hole_density": 0.1, "overhangs": 5, "caves": 3, "garbage_lines": 2}
+}
+
+
+def column_surface(grid, x): 
+    # row of the column's top block (len(grid) if the column is empty)
+    for y, row in enumerate(grid): 
+        if(row[x]): 
+            return y
+    return len(grid)
+
+
+def stress_board(rng, stack_height=8, hole_density=0.1, overhangs=0, caves=0, garbage_lines=0, height=MATRIX_HEIGHT, width=MATRIX_WIDTH): 
+    # grid (list[list[int]], top row first) built bottom up: garbage lines, a ragged stack, then overhangs and caves on top
+    grid = [[0] * width for _ in range(height)]
+    max_stack = height - SPAWN_CLEARANCE
+    
+    # garbage lines: full rows with one hole each
+    garbage_lines = min(garbage_lines, max_stack)
+    for y in range(height - garbage_lines, height): 
+        hole = rng.randrange(width)
+        grid[y] = [0 if x == hole else 1 for x in range(width)]
+    
+    # ragged stack on top of the garbage, every cell under the surface can be a hole
+    for x in range(width): 
+        column_height = max(garbage_lines, min(max_stack, stack_height + rng.randint(-2, 2)))
+        for y in range(height - column_height, height - garbage_lines): 
+            grid[y][x] = 0 if rng.random() < hole_density else 1
+    
+    # overhangs: a pillar with a ledge sticking out over empty space (room to slide and tuck pieces under)
+    for _ in range(overhangs): 
+        length = rng.randint(2, 4)
+        x = rng.randrange(width - length + 1)
+        y = min(column_surface(grid, c) for c in range(x, x + length)) - rng.randint(2, 3)
+        if(y < SPAWN_CLEARANCE): 
+            continue
+        for pillar_y in range(y, column_surface(grid, x)): 
+            grid[pillar_y][x] = 1
+        for c in range(x, x + length): 
+            grid[y][c] = 1
+    
+    # caves: a two row tunnel under a solid roof, only open at one end (pieces have to kick in, T-spin style)
+    for _ in range(caves): 
+        length = rng.randint(3, 5)
+        x = rng.randrange(width - length + 1)
+        roof = max(column_surface(grid, c) for c in range(x, x + length))
+        if(roof < SPAWN_CLEARANCE or roof + 2 >= height): 
+            continue
+        for c in range(x, x + length): 
+            grid[roof][c] = 1
+            grid[roof + 1][c] = 0
+            grid[roof + 2][c] = 0
+        entrance = x if rng.random() < 0.5 else x + length - 1
+        for y in range(column_surface(grid, entrance), roof + 1): 
+            grid[y][entrance] = 0
+    
+    # a ragged stack, ledge or cave roof can still fill a whole row, punch a random hole in those like a garbage line
+    for row in grid: 
+        if(all(row)): 
+            row[rng.randrange(width)] = 0
+    
+    return grid
+
+
+def stress_boards(per_profile=STRESS_BOARDS_PER_PROFILE, seed=STRESS_SEED): 
+    # [(board name, grid)] with per_profile boards of every profile (seeded, same boards every run)
+    rng = random.Random(seed)
+    return [(f"stress_{name}_{i}", stress_board(rng, **profile)) for name, profile in STRESS_PROFILES.items() for i in range(per_profile)]
+
+
+def random_stress_board(rng): 
+    return stress_board(rng, **STRESS_PROFILES[rng.choice(sorted(STRESS_PROFILES))])
+
+
+def main(): 
+    # prints how hard every stress board is on the scanner (BFS nodes, moves and scan time for the slowest piece)
+    parser = argparse.ArgumentParser(description="generates adversarial boards and shows how hard they are on the MoveScanner")
+    parser.add_argument("--per-profile", type=int, default=STRESS_BOARDS_PER_PROFILE, help="boards per profile")
+    parser.add_argument("--seed", type=int, default=STRESS_SEED, help="generator seed")
+    parser.add_argument("--show", action="store_true", help="draw every board")
+    args = parser.parse_args()
+    
+    print(f"{'board':<24}{'worst piece':>12}{'bfs nodes':>12}{'moves':>8}{'scan (ms)':>12}")
+    for name, grid in stress_boards(args.per_profile, args.seed): 
+        board = Board()
+        board.board = grid
+        worst = None
+        for pk in SHAPES: 
+            if(not can_spawn(board, pk)): 
+                continue
+            elapsed = float('inf')
+            for _ in range(SCAN_REPEATS): 
+                profiler = Profiler()
+                scanner = MoveScanner(cache_size=0, profiler=profiler)
+                start = time.perf_counter()
+                moves = scanner.get_all_legal_moves(BoardOnly(board), pk)
+                elapsed = min(elapsed, time.perf_counter() - start)
+            result = (elapsed, pk, profiler.counters.get("bfs_nodes", 0), len(moves))
+            if(worst is None or result > worst): 
+                worst = result
+        elapsed, pk, nodes, moves = worst
+        print(f"{name:<24}{pk:>12}{nodes:>12}{moves:>8}{elapsed * 1000:>12.2f}")
+        if(args.show): 
+            print("\n".join("".join("[]" if cell else " ." for cell in row) for row in grid))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,25 @@
-from settings import MATRIX_HEIGHT, MATRIX_WIDTH, PIECE_PREVIEW_AMOUNT, NORMAL_SPAWN_POSITION_X, NORMAL_SPAWN_POSITION_Y, I_PIECE_SPAWN_POSITION_X, I_PIECE_SPAWN_POSITION_Y, LINES_CLEARED_FOR_NEXT_LEVEL, B2B_MULTIPLIER, COMBO_BONUS, MAX_LEVEL, SHAPES, SRS_TABLE
+from settings import MATRIX_HEIGHT, MATRIX_WIDTH, PIECE_PREVIEW_AMOUNT, NORMAL_SPAWN_POSITION_X, NORMAL_SPAWN_POSITION_Y, I_PIECE_SPAWN_POSITION_X, I_PIECE_SPAWN_POSITION_Y, LINES_CLEARED_FOR_NEXT_LEVEL, B2B_MULTIPLIER, COMBO_BONUS, MAX_LEVEL, SHAPES, SRS_TABLE, MOVE_CACHE_SIZE, MOVEMENT_MODEL, DEDUPE_PLACEMENTS
+from profiler import NULL_PROFILER
 import random
-from collections import deque
+from collections import deque, OrderedDict
+
+
+class PieceBag: 
+    # 7-bag piece generator, seeded bags give the same piece sequence every game
+    def __init__(self, seed=None): 
+        # unseeded bags share the global random module
+        self.seed = seed
+        self.rng = random if seed is None else random.Random(seed)
+        
+    def next_bag(self): 
+        new_bag = ['I', 'O', 'T', 'J', 'L', 'S', 'Z']
+        self.rng.shuffle(new_bag)
+        return new_bag
+
 
 
 class TetrisGame:
-    def __init__(self):
+    def __init__(self, seed=None, piece_bag=None):
         self.score = 0
         self.level = 1 # start at level 1
         self.lines_cleared = 0
@@ -20,6 +35,8 @@ class TetrisGame:
         self.board = Board()
         
         self.bag = []
+        # seeded games get their own piece sequence (same seed = same pieces)
+        self.piece_bag = piece_bag if piece_bag is not None else PieceBag(seed)
         
         self.spawn_piece() 
     
@@ -114,18 +131,13 @@ class TetrisGame:
     def spawn_piece(self):
         # refills the bag if it has less than 7 pieces
         if len(self.bag) < 7: 
-            new_bag = ['I', 'O', 'T', 'J', 'L', 'S', 'Z']
-            random.shuffle(new_bag)
-            self.bag.extend(new_bag)
+            self.bag.extend(self.piece_bag.next_bag())
             
         # take a random piece out of the bag
         self.current_piece_key = self.bag.pop(0)
         
-        if(self.current_piece_key == 'I'): 
-            if(not is_valid_position(self.board, I_PIECE_SPAWN_POSITION_X, I_PIECE_SPAWN_POSITION_Y, 0, self.current_piece_key)): 
-                self.game_over = True
-        elif(self.current_piece_key is not None): 
-            if(not is_valid_position(self.board, NORMAL_SPAWN_POSITION_X, NORMAL_SPAWN_POSITION_Y, 0, self.current_piece_key)): 
+        if(self.current_piece_key is not None): 
+            if(not can_spawn(self.board, self.current_piece_key)): 
                 self.game_over = True
         
     def hold_piece(self): 
@@ -151,26 +163,289 @@ class TetrisGame:
     
 
 class Board: 
+    # bitboard version of the board, each row is an int where bit x = column x
+    # same public stuff as ListBoard (lock/unlock/clear/board) but collisions are just ANDs
+    # also keeps column heights, holes per column and filled cells per row up to date as pieces lock/unlock/clear
     def __init__(self, height=MATRIX_HEIGHT, width=MATRIX_WIDTH): 
         self.height = height
         self.width = width
-        self.board = [[0] * width for _ in range(height)]
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        
+        self.heights = [0] * width # height of each column (0 = empty)
+        self.col_holes = [0] * width # empty cells under each column's top block
+        self.row_counts = [0] * height # filled cells in each row
+        self.full_rows = 0 # rows that are completely filled (waiting on clear_lines)
+        
+        # zobrist hash of the filled cells (XOR of one random key per filled cell)
+        self.zobrist_keys = get_zobrist_keys(height, width)
+        self.hash = 0
+    
+    @property
+    def board(self): 
+        # builds the old list[list[int]] grid (for printing and such, NOT fast)
+        width = self.width
+        return [[(row >> x) & 1 for x in range(width)] for row in self.rows]
+    
+    @board.setter
+    def board(self, grid): 
+        self.height = len(grid)
+        self.width = len(grid[0])
+        self.full_row = (1 << self.width) - 1
+        self.zobrist_keys = get_zobrist_keys(self.height, self.width)
+        self.rows = [sum(1 << x for x, cell in enumerate(row) if cell) for row in grid]
+        self.recount()
+        
+    def recount(self): 
+        # rebuilds heights/holes/row counts/hash from scratch (after clears or when rows were set by hand)
+        height = self.height
+        full_row = self.full_row
+        zobrist_keys = self.zobrist_keys
+        heights = [0] * self.width
+        col_holes = [0] * self.width
+        board_hash = 0
+        
+        # walk rows top down, seen = every column whose top block has been found already
+        seen = 0
+        for y, row in enumerate(self.rows): 
+            cells = row
+            while cells: 
+                low_bit = cells & -cells
+                board_hash ^= zobrist_keys[y][low_bit.bit_length() - 1]
+                cells ^= low_bit
+            
+            new_cols = row & ~seen
+            while new_cols: 
+                low_bit = new_cols & -new_cols
+                heights[low_bit.bit_length() - 1] = height - y
+                new_cols ^= low_bit
+            seen |= row
+            
+            holes = seen & ~row
+            while holes: 
+                low_bit = holes & -holes
+                col_holes[low_bit.bit_length() - 1] += 1
+                holes ^= low_bit
+        
+        self.heights = heights
+        self.col_holes = col_holes
+        self.hash = board_hash
+        self.row_counts = [bin(row).count("1") for row in self.rows]
+        self.full_rows = sum(1 for row in self.rows if row == full_row)
+        
+    def copy(self): 
+        new_board = Board.__new__(Board)
+        new_board.height = self.height
+        new_board.width = self.width
+        new_board.full_row = self.full_row
+        new_board.rows = self.rows[:]
+        new_board.heights = self.heights[:]
+        new_board.col_holes = self.col_holes[:]
+        new_board.row_counts = self.row_counts[:]
+        new_board.full_rows = self.full_rows
+        new_board.zobrist_keys = self.zobrist_keys
+        new_board.hash = self.hash
+        return new_board
+        
+    def is_occupied(self, x, y): 
+        return (self.rows[y] >> x) & 1 == 1
+    
+    def is_valid_position(self, start_x, start_y, start_rot, piece_key): 
+        row_masks, min_c, max_c, max_r = PIECE_MASKS[piece_key][start_rot % 4]
+        
+        # check board boundaries
+        if start_x + min_c < 0 or start_x + max_c >= self.width: 
+            return False
+        if start_y + max_r >= self.height: 
+            return False
+        
+        # check overlap with other blocks (rows above the board are fine)
+        shift = start_x + min_c
+        rows = self.rows
+        for r, mask in row_masks: 
+            board_y = start_y + r
+            if board_y >= 0 and rows[board_y] & (mask << shift): 
+                return False
+        return True
         
     def lock_piece(self, x, y, rotation, piece_key): 
-        actual_piece = get_piece_shape(piece_key, rotation)
+        row_masks, min_c, max_c, max_r = PIECE_MASKS[piece_key][rotation % 4]
+        shift = x + min_c
+        rows = self.rows
+        for r, mask in row_masks: 
+            rows[y + r] |= mask << shift
+        
+        # cells above the board wrap around (python negative indexing), easier to just recount
+        if y + row_masks[0][0] < 0: 
+            self.recount()
+            return
+        
+        height = self.height
+        width = self.width
+        heights = self.heights
+        col_holes = self.col_holes
+        row_counts = self.row_counts
+        zobrist_keys = self.zobrist_keys
+        board_hash = self.hash
+        # cells go bottom to top (PIECE_BOTTOM_UP_CELLS), so a piece's own lower cells never count as holes
+        for c, r in PIECE_BOTTOM_UP_CELLS[piece_key][rotation % 4]: 
+            board_x = x + c
+            board_y = y + r
+            board_hash ^= zobrist_keys[board_y][board_x]
+            
+            top_y = height - heights[board_x]
+            if board_y < top_y: 
+                # new top block, everything between it and the old top (or the floor) is now a hole
+                col_holes[board_x] += top_y - board_y - 1
+                heights[board_x] = height - board_y
+            else: 
+                # filled in a hole
+                col_holes[board_x] -= 1
+            
+            row_counts[board_y] += 1
+            if row_counts[board_y] == width: 
+                self.full_rows += 1
         
-        for r, row in enumerate(actual_piece): 
-            for c, val in enumerate(row): 
-                if val:
-                    self.board[y + r][x + c] = 1
+        self.hash = board_hash
                     
     def unlock_piece(self, x, y, rotation, piece_key): 
-        actual_piece = get_piece_shape(piece_key, rotation)
+        row_masks, min_c, max_c, max_r = PIECE_MASKS[piece_key][rotation % 4]
+        rows = self.rows
+        
+        # cells above the board wrap around (python negative indexing), easier to just recount
+        if y + row_masks[0][0] < 0: 
+            shift = x + min_c
+            for r, mask in row_masks: 
+                rows[y + r] &= ~(mask << shift)
+            self.recount()
+            return
+        
+        height = self.height
+        width = self.width
+        heights = self.heights
+        col_holes = self.col_holes
+        row_counts = self.row_counts
+        zobrist_keys = self.zobrist_keys
+        board_hash = self.hash
+        # cells go top to bottom and come off one at a time, so a column's top block is always removed first
+        # and the search for the next top block still sees the piece's lower cells
+        for c, r in PIECE_TABLE[piece_key][rotation % 4]['cells']: 
+            board_x = x + c
+            board_y = y + r
+            bit = 1 << board_x
+            rows[board_y] &= ~bit
+            board_hash ^= zobrist_keys[board_y][board_x]
+            
+            if board_y == height - heights[board_x]: 
+                # removed the top block, drop down to the next block (skipped cells were holes)
+                next_y = board_y + 1
+                while next_y < height and not rows[next_y] & bit: 
+                    next_y += 1
+                if next_y < height: 
+                    col_holes[board_x] -= next_y - board_y - 1
+                    heights[board_x] = height - next_y
+                else: 
+                    col_holes[board_x] = 0
+                    heights[board_x] = 0
+            else: 
+                # opened up a hole under the top block
+                col_holes[board_x] += 1
+            
+            if row_counts[board_y] == width: 
+                self.full_rows -= 1
+            row_counts[board_y] -= 1
+        
+        self.hash = board_hash
+                    
+    def clear_lines(self): 
+        # clears all full rows (row == all 1s)
+        full_row = self.full_row
+        new_rows = [row for row in self.rows if row != full_row]
+        
+        lines_cleared = self.height - len(new_rows)
+        if(lines_cleared): 
+            self.rows = [0] * lines_cleared + new_rows
+            self.recount()
+        
+        return lines_cleared
+    
+    def placement_stats(self, x, y, rotation, piece_key): 
+        # (heights, holes, completed lines) the board WOULD have with this piece locked, without locking it
+        # only touches the piece's cells + one copy of the heights, so it's O(piece cells + width)
+        row_masks, min_c, max_c, max_r = PIECE_MASKS[piece_key][rotation % 4]
+        if y + row_masks[0][0] < 0: 
+            self.lock_piece(x, y, rotation, piece_key)
+            result = (self.heights[:], sum(self.col_holes), self.full_rows)
+            self.unlock_piece(x, y, rotation, piece_key)
+            return result
+        
+        height = self.height
+        heights = self.heights[:]
+        holes = sum(self.col_holes)
+        for c, r in PIECE_BOTTOM_UP_CELLS[piece_key][rotation % 4]: 
+            board_x = x + c
+            board_y = y + r
+            
+            top_y = height - heights[board_x]
+            if board_y < top_y: 
+                holes += top_y - board_y - 1
+                heights[board_x] = height - board_y
+            else: 
+                holes -= 1
         
-        for r, row in enumerate(actual_piece): 
-            for c, val in enumerate(row): 
-                if val:
-                    self.board[y + r][x + c] = 0
+        lines = self.full_rows
+        full_row = self.full_row
+        shift = x + min_c
+        rows = self.rows
+        for r, mask in row_masks: 
+            if rows[y + r] | (mask << shift) == full_row: 
+                lines += 1
+        
+        return heights, holes, lines
+
+
+
+class ListBoard: 
+    # original list[list[int]] board, kept around as the reference implementation
+    def __init__(self, height=MATRIX_HEIGHT, width=MATRIX_WIDTH): 
+        self.height = height
+        self.width = width
+        self.board = [[0] * width for _ in range(height)]
+        
+    def copy(self): 
+        new_board = ListBoard(self.height, self.width)
+        new_board.board = [row[:] for row in self.board]
+        return new_board
+        
+    def is_occupied(self, x, y): 
+        return self.board[y][x] == 1
+    
+    def is_valid_position(self, start_x, start_y, start_rot, piece_key): 
+        # checks if a piece fits at (target_x, target_y) coordinates
+        # returns False if it hits the wall, hits the floor, or intersects with another block
+        for x, y in PIECE_TABLE[piece_key][start_rot % 4]['cells']: 
+            board_x = start_x + x
+            board_y = start_y + y
+
+            # check board boundaries
+            if board_x < 0 or board_x >= self.width:
+                return False
+            if board_y >= self.height:
+                return False
+
+            # check overlap with other blocks
+            if board_y >= 0:
+                if self.board[board_y][board_x] == 1:
+                    return False
+        return True
+        
+    def lock_piece(self, x, y, rotation, piece_key): 
+        for c, r in PIECE_TABLE[piece_key][rotation % 4]['cells']: 
+            self.board[y + r][x + c] = 1
+                    
+    def unlock_piece(self, x, y, rotation, piece_key): 
+        for c, r in PIECE_TABLE[piece_key][rotation % 4]['cells']: 
+            self.board[y + r][x + c] = 0
                     
     def clear_lines(self): 
         # clears all rows of only 1s
@@ -186,19 +461,209 @@ class Board:
 
 
 
+class MoveCache: 
+    # bounded LRU cache of legal move lists, keyed by (board hash, piece key)
+    def __init__(self, max_entries=MOVE_CACHE_SIZE): 
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def get(self, key): 
+        moves = self.entries.get(key)
+        if moves is None: 
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return moves
+    
+    def put(self, key, moves): 
+        self.entries[key] = moves
+        self.entries.move_to_end(key)
+        
+        # kick out the least recently used entry once it's over the limit
+        if len(self.entries) > self.max_entries: 
+            self.entries.popitem(last=False)
+            self.evictions += 1
+            
+    def stats(self): 
+        return {
+            "hits": self.hits, 
+            "misses": self.misses, 
+            "evictions": self.evictions, 
+            "entries": len(self.entries)
+        }
+
+
+
+MOVEMENT_MODELS = ("hard_drop", "soft_drop", "srs")
+
+
 class MoveScanner: 
+    # movement models (all return the same (x, y, r, piece_key, T-spin) tuples): 
+    #     "hard_drop": rotate at spawn, slide along that row, then drop straight down (landing row from column heights, no search)
+    #     "soft_drop": same start, but the piece can also slide under overhangs on the way down (tucks, no rotating)
+    #     "srs": full BFS with moves, rotations and SRS kicks (T-spins included)
+    def __init__(self, cache_size=MOVE_CACHE_SIZE, profiler=NULL_PROFILER, movement_model=MOVEMENT_MODEL, dedupe=DEDUPE_PLACEMENTS): 
+        # cache_size = max (board, piece) move lists kept around (0 = no cache)
+        if movement_model not in MOVEMENT_MODELS: 
+            raise ValueError(f"unknown movement model: {movement_model} (choose from {', '.join(MOVEMENT_MODELS)})")
+        self.cache = MoveCache(cache_size) if cache_size > 0 else None
+        self.profiler = profiler # counts BFS nodes and kick tests when it's a real Profiler
+        self.movement_model = movement_model
+        self.dedupe = dedupe # one move per distinct set of filled cells (see dedupe_placements)
+    
     def get_all_legal_moves(self, game, piece_key): 
         board = game.board
+        
+        # only bitboards keep a hash
+        if self.cache is None or not hasattr(board, 'hash'): 
+            return self.scan(board, piece_key)
+        
+        # the model is part of the key so switching models on a scanner never returns stale moves
+        key = (board.hash, piece_key, self.movement_model)
+        moves = self.cache.get(key)
+        if moves is None: 
+            moves = self.scan(board, piece_key)
+            self.cache.put(key, moves)
+        
+        # copy so callers can't change what's in the cache
+        return moves[:]
+    
+    def scan(self, board, piece_key): 
+        if(self.movement_model == "hard_drop"): 
+            moves = self.scan_hard_drops(board, piece_key)
+        elif(self.movement_model == "soft_drop"): 
+            moves = self.scan_soft_drops(board, piece_key)
+        else: 
+            moves = self.scan_board(board, piece_key)
+        
+        if(self.dedupe): 
+            return dedupe_placements(moves)
+        return moves
+    
+    def top_positions(self, board, piece_key): 
+        # every (x, y, rotation) reachable from spawn by sliding and rotating (SRS kicks), without moving down
+        fits = board.is_valid_position
+        start_x, start_y = get_spawn_position(piece_key)
+        if(not fits(start_x, start_y, 0, piece_key)): 
+            return []
+        
+        visited = {(start_x, start_y, 0)}
+        queue = deque(visited)
+        while(queue): 
+            cur_x, cur_y, cur_r = queue.popleft()
+            next_positions = [(cur_x - 1, cur_y, cur_r), (cur_x + 1, cur_y, cur_r)]
+            for dr in (-1, 1): 
+                new_r = (cur_r + dr) % 4
+                for dx, dy in SRS_TABLE[piece_key][cur_r][new_r]: 
+                    if(fits(cur_x + dx, cur_y + dy, new_r, piece_key)): 
+                        next_positions.append((cur_x + dx, cur_y + dy, new_r))
+                        break # first kick that fits, same as the full BFS
+            
+            for position in next_positions: 
+                if(position not in visited and fits(*position, piece_key)): 
+                    visited.add(position)
+                    queue.append(position)
+        
+        # rotation then column order, so the move list doesn't depend on the search order
+        return sorted(visited, key = lambda position: (position[2], position[0], position[1]))
+    
+    def scan_hard_drops(self, board, piece_key): 
+        # no search at all: rotate at spawn (SRS kicks), slide along that row as far as the piece fits,
+        # and every column it reaches drops straight down to the landing row from the column heights
+        fits = board.is_valid_position
+        height = board.height
+        heights = board.heights if hasattr(board, 'heights') else column_heights(board)
+        start_x, start_y = get_spawn_position(piece_key)
+        if(not fits(start_x, start_y, 0, piece_key)): 
+            return []
+        
+        # where every rotation ends up when it's done at spawn (first kick that fits, 180 goes through 1 or 3)
+        starts = {0: (start_x, start_y)}
+        for from_r, to_r in ((0, 1), (0, 3), (1, 2), (3, 2)): 
+            if(from_r not in starts or to_r in starts): 
+                continue
+            x, y = starts[from_r]
+            for dx, dy in SRS_TABLE[piece_key][from_r][to_r]: 
+                if(fits(x + dx, y + dy, to_r, piece_key)): 
+                    starts[to_r] = (x + dx, y + dy)
+                    break
+        
+        moves = []
+        positions = 0
+        for r in sorted(starts): 
+            x, y = starts[r]
+            left = x
+            while fits(left - 1, y, r, piece_key): 
+                left -= 1
+            right = x
+            while fits(right + 1, y, r, piece_key): 
+                right += 1
+            positions += right - left + 1
+            
+            bottom = PIECE_TABLE[piece_key][r]['bottom']
+            for x in range(left, right + 1): 
+                land_y = min(height - heights[x + c] - bottom_y - 1 for c, bottom_y in bottom)
+                if(land_y < y): 
+                    # the piece is already under a block in one of its columns, the heights can't tell where it lands
+                    land_y = y
+                    while fits(x, land_y + 1, r, piece_key): 
+                        land_y += 1
+                moves.append((x, land_y, r, piece_key, 0))
+        
+        if(self.profiler.enabled): 
+            self.profiler.count("bfs_nodes", positions)
+        return moves
+    
+    def scan_soft_drops(self, board, piece_key): 
+        # BFS over left/right/down only, starting from every top position (so no rotating under overhangs)
+        fits = board.is_valid_position
         pk = piece_key
+        
         moves = []
+        queue = deque(self.top_positions(board, pk))
+        visited = set(queue)
+        while(queue): 
+            cur_x, cur_y, cur_r = queue.popleft()
+            
+            if(fits(cur_x, cur_y + 1, cur_r, pk)): 
+                if((cur_x, cur_y + 1, cur_r) not in visited): 
+                    visited.add((cur_x, cur_y + 1, cur_r))
+                    queue.append((cur_x, cur_y + 1, cur_r))
+            else: 
+                moves.append((cur_x, cur_y, cur_r, pk, 0)) # can't go down any more (no T-spins without rotating)
+            
+            for new_x in (cur_x - 1, cur_x + 1): 
+                if((new_x, cur_y, cur_r) not in visited and fits(new_x, cur_y, cur_r, pk)): 
+                    visited.add((new_x, cur_y, cur_r))
+                    queue.append((new_x, cur_y, cur_r))
         
-        start_x = NORMAL_SPAWN_POSITION_X
-        start_y = NORMAL_SPAWN_POSITION_Y
+        if(self.profiler.enabled): 
+            self.profiler.count("bfs_nodes", len(visited))
+        return moves
+    
+    def scan_board(self, board, piece_key): 
+        # BFS over every reachable (x, y, rotation) for the piece
+        fits = board.is_valid_position
+        fits_kick = fits
+        
+        # profiling swaps in a counting version for kick tests (nothing extra runs when it's off)
+        kick_tests = [0]
+        if(self.profiler.enabled): 
+            def fits_kick(x, y, r, pk): 
+                kick_tests[0] += 1
+                return fits(x, y, r, pk)
+        
+        pk = piece_key
+        moves = []
+        
+        start_x, start_y = get_spawn_position(pk)
         start_r = 0
-
-        if(pk == 'I'): 
-            start_x = I_PIECE_SPAWN_POSITION_X
-            start_y = I_PIECE_SPAWN_POSITION_Y
         
         # BFS setup
         queue = deque()
@@ -223,7 +688,7 @@ class MoveScanner:
                 new_x, new_y, new_r = cur_x + dx, cur_y + dy, cur_r + dr
                 
                 if((new_x, new_y, new_r) not in visited): 
-                    if(is_valid_position(board, new_x, new_y, new_r, pk)): 
+                    if(fits(new_x, new_y, new_r, pk)): 
                         visited.add((new_x, new_y, new_r))
                         queue.append((new_x, new_y, new_r))
                         if(dx == 0 and dy == 1): 
@@ -258,7 +723,7 @@ class MoveScanner:
                     dx, dy = kick[0], kick[1]
                     new_x, new_y = cur_x + dx, cur_y + dy
                     
-                    if(is_valid_position(board, new_x, new_y, new_r, pk)): 
+                    if(fits_kick(new_x, new_y, new_r, pk)): 
                         if((new_x, new_y, new_r) not in visited): 
                             visited.add((new_x, new_y, new_r))
                             queue.append((new_x, new_y, new_r))
@@ -268,6 +733,10 @@ class MoveScanner:
                                 last_move_queue.append("R") # last move for this new appended placement-to-visit was a rotation
                         break # possible rotation found OR already visited the possible kick -> end kick testing
         
+        if(self.profiler.enabled): 
+            self.profiler.count("bfs_nodes", len(visited)) # every visited placement gets expanded once
+            self.profiler.count("kick_tests", kick_tests[0])
+        
         return moves
     
     
@@ -276,9 +745,7 @@ class MoveScanner:
         # returns 1 if Mini t-spin
         # returns 2 if T-spin
         
-        to_check = [(0,0), (2,0), (2,2), (0,2)]
-        for rot in range(start_r): 
-            to_check.append(to_check.pop(0))
+        to_check = T_SPIN_CORNERS[start_r % 4]
         # first two in to_check will always be front corners, last two will always be back corners
         
         front_corners_occupied = 0
@@ -294,7 +761,7 @@ class MoveScanner:
                 else: 
                     back_corners_occupied += 1
             else: 
-                if(board.board[board_y][board_x] == 1): 
+                if(board.is_occupied(board_x, board_y)): 
                     # if the corner actually has a block
                     if(i < 2): 
                         front_corners_occupied += 1
@@ -308,28 +775,53 @@ class MoveScanner:
         return 0
     
     
+def get_spawn_position(piece_key): 
+    if(piece_key == 'I'): 
+        return I_PIECE_SPAWN_POSITION_X, I_PIECE_SPAWN_POSITION_Y
+    return NORMAL_SPAWN_POSITION_X, NORMAL_SPAWN_POSITION_Y
+    
+def can_spawn(board, piece_key): 
+    # False = the piece is blocked at its spawn position (game over)
+    start_x, start_y = get_spawn_position(piece_key)
+    return is_valid_position(board, start_x, start_y, 0, piece_key)
+    
+def dedupe_placements(moves): 
+    # keeps one move per set of filled cells (O has 4 rotations of every landing, S/Z/I have 2 of most)
+    # the first copy keeps its place in the list (so ties still go to the same move), with the best T-spin flag of its copies
+    # pieces poking out the top are left alone, their cells wrap around (see Board.lock_piece)
+    unique = []
+    seen = {} # cells -> index in unique
+    for move in moves: 
+        x, y, r, pk, T_spin = move
+        row_masks, min_c, max_c, max_r = PIECE_MASKS[pk][r % 4]
+        if y + row_masks[0][0] < 0: 
+            unique.append(move)
+            continue
+        
+        shift = x + min_c
+        cells = tuple((y + row, mask << shift) for row, mask in row_masks)
+        index = seen.get(cells)
+        if index is None: 
+            seen[cells] = len(unique)
+            unique.append(move)
+        elif T_spin > unique[index][4]: 
+            unique[index] = move
+    return unique
+    
+def column_heights(board): 
+    # height of each column (0 = empty) for boards that don't keep them (ListBoard)
+    heights = [0] * board.width
+    for x in range(board.width): 
+        for y in range(board.height): 
+            if(board.is_occupied(x, y)): 
+                heights[x] = board.height - y
+                break
+    return heights
+    
 def is_valid_position(board, start_x, start_y, start_rot, piece_key): 
     # checks if a piece fits at (target_x, target_y) coordinates
     # returns False if it hits the wall, hits the floor, or intersects with another block
-    actual_piece = get_piece_shape(piece_key, start_rot)
-    
-    for y, row in enumerate(actual_piece): 
-        for x, cell in enumerate(row): 
-            if cell: 
-                board_x = start_x + x
-                board_y = start_y + y
-
-                # check board boundaries
-                if board_x < 0 or board_x >= board.width:
-                    return False
-                if board_y >= board.height:
-                    return False
-
-                # check overlap with other blocks
-                if board_y >= 0:
-                    if board.board[board_y][board_x] == 1:
-                        return False
-    return True            
+    return board.is_valid_position(start_x, start_y, start_rot, piece_key)
     
 def get_piece_shape(pk, rotation): # does NOT return offsets, MUST do offsets later for rotations (for I and O pieces)
     result = SHAPES[pk]
@@ -339,38 +831,78 @@ def get_piece_shape(pk, rotation): # does NOT return offsets, MUST do offsets la
         result = [list(row) for row in zip(*result[::-1])]
         
     return result
-  
-# T-spin debugging
-# 37 moves, 3 t-spins (2 normal, 1 mini)
-  
-# def debug(): 
-#     board = Board()
-#     board.board = [
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-#         [0, 0, 0, 0, 0, 0, 1, 1, 0, 0],
-#         [0, 0, 0, 1, 0, 0, 0, 1, 1, 0],
-#         [1, 1, 1, 1, 1, 0, 1, 1, 1, 1]
-#     ]
-    
-#     scanner = MoveScanner()
-#     moves = scanner.get_all_legal_moves(board, 'T')
-#     print(len(moves))
 
-# if __name__ == "__main__": 
-#     debug()
\ No newline at end of file
+
+def build_piece_table(): 
+    # everything about every (piece, rotation), built once at import so nothing rotates matrices mid-game
+    # PIECE_TABLE[pk][r] = {
+    #     'cells': ((x, y), ...) occupied offsets from the piece's top-left (same as get_piece_shape)
+    #     'bbox': (min_x, min_y, max_x, max_y) of the occupied cells
+    #     'bottom': ((x, lowest y), ...) per occupied column, for dropping pieces onto column heights
+    #     'row_masks': ((y, mask), ...) row bitmasks with min_x shifted to bit 0
+    # }
+    piece_table = {}
+    for pk in SHAPES: 
+        rotations = []
+        for rotation in range(4): 
+            shape = get_piece_shape(pk, rotation)
+            cells = tuple((x, y) for y, row in enumerate(shape) for x, val in enumerate(row) if val)
+            min_x = min(x for x, y in cells)
+            max_x = max(x for x, y in cells)
+            min_y = min(y for x, y in cells)
+            max_y = max(y for x, y in cells)
+            
+            bottom = tuple((col, max(y for x, y in cells if x == col)) for col in range(min_x, max_x + 1))
+            
+            row_masks = []
+            for y in range(min_y, max_y + 1): 
+                mask = 0
+                for cx, cy in cells: 
+                    if cy == y: 
+                        mask |= 1 << (cx - min_x)
+                row_masks.append((y, mask))
+            
+            rotations.append({
+                'cells': cells, 
+                'bbox': (min_x, min_y, max_x, max_y), 
+                'bottom': bottom, 
+                'row_masks': tuple(row_masks)
+            })
+        piece_table[pk] = rotations
+    return piece_table
+
+def build_t_spin_corners(): 
+    # corners of the T's 3x3 box per rotation, first two are always the front corners, last two the back corners
+    corners = []
+    to_check = [(0,0), (2,0), (2,2), (0,2)]
+    for rotation in range(4): 
+        corners.append(tuple(to_check))
+        to_check.append(to_check.pop(0))
+    return corners
+
+def get_zobrist_keys(height, width): 
+    # one random 64 bit key per cell, same keys for every board of the same size (fixed seed)
+    if (height, width) not in ZOBRIST_KEYS: 
+        rng = random.Random(f"zobrist {height}x{width}")
+        ZOBRIST_KEYS[(height, width)] = [[rng.getrandbits(64) for _ in range(width)] for _ in range(height)]
+    return ZOBRIST_KEYS[(height, width)]
+
+ZOBRIST_KEYS = {}
+
+PIECE_TABLE = build_piece_table()
+
+# cells ordered bottom row first, for stacking pieces onto column heights
+PIECE_BOTTOM_UP_CELLS = {
+    pk: [tuple(reversed(entry['cells'])) for entry in rotations] 
+    for pk, rotations in PIECE_TABLE.items()
+}
+T_SPIN_CORNERS = build_t_spin_corners()
+
+# flattened hot path view of PIECE_TABLE (tuple unpacking beats dict lookups in is_valid_position)
+# PIECE_MASKS[pk][r] = (row_masks, min_x, max_x, max_y)
+PIECE_MASKS = {
+    pk: [(entry['row_masks'], entry['bbox'][0], entry['bbox'][2], entry['bbox'][3]) for entry in rotations] 
+    for pk, rotations in PIECE_TABLE.items()
+}
+  
+# T-spin debugging board lives in debug.py (37 moves, 3 t-spins (2 normal, 1 mini))
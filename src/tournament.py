@@ -0,0 +1,179 @@
+from trainer import playGame
+from tetris_engine import MOVEMENT_MODELS
+from settings import MOVEMENT_MODEL
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import json
+import math
+import os
+import statistics
+import time
+
+# Brain tournament: plays every brain on the same seeded games and compares them
+# every brain gets the same seeds, so brains can be compared game by game (paired comparison)
+
+BRAINS_GLOB = "brains/*.json"
+GAMES_PER_BRAIN = 10
+MOVES_LIMIT = 1000 # 0 = play every game until game over (good brains can go on for hours)
+FIRST_SEED = 0 # games use seeds FIRST_SEED, FIRST_SEED + 1, ...
+OUTPUT_PATH = "tournament_output.jsonl"
+PERCENTILES = (10, 25, 75, 90)
+
+
+def load_brain(path): 
+    # brain files are [score, weights] (same as best_brain.json)
+    with open(path, "r") as r: 
+        score, weights = json.load(r)
+    return weights
+
+
+def brain_name(path): 
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def play_timed_game(weights, seed, moves_limit, movement_model=MOVEMENT_MODEL): 
+    # returns (score, moves, seconds)
+    start = time.perf_counter()
+    score, moves, snapshot = playGame(weights, seed, moves_limit, movement_model=movement_model)
+    return (score, moves, time.perf_counter() - start)
+
+
+def play_tournament(brains, seeds, moves_limit, workers=None, movement_model=MOVEMENT_MODEL): 
+    # plays every brain on every seed
+    # yields (brain index, seed index, (score, moves, seconds)) as soon as each game finishes
+    tasks = [(i, j) for i in range(len(brains)) for j in range(len(seeds))]
+    
+    if(workers == 1): 
+        for i, j in tasks: 
+            yield i, j, play_timed_game(brains[i], seeds[j], moves_limit, movement_model)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool: 
+        futures = {pool.submit(play_timed_game, brains[i], seeds[j], moves_limit, movement_model): (i, j) for i, j in tasks}
+        for future in as_completed(futures): 
+            i, j = futures[future]
+            yield i, j, future.result()
+
+
+# --------------------------STATS--------------------------
+
+def percentile(values, p): 
+    # linear interpolation between the closest ranks
+    values = sorted(values)
+    position = (len(values) - 1) * p / 100
+    low = math.floor(position)
+    high = math.ceil(position)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def summarize(scores, moves, seconds): 
+    summary = {
+        "games": len(scores),
+        "mean": statistics.mean(scores),
+        "median": statistics.median(scores),
+        "stdev": statistics.stdev(scores) if len(scores) > 1 else 0.0,
+        "min": min(scores),
+        "max": max(scores),
+        "mean_moves": statistics.mean(moves),
+        "pieces_per_second": sum(moves) / sum(seconds) if sum(seconds) else 0.0
+    }
+    for p in PERCENTILES: 
+        summary[f"p{p}"] = percentile(scores, p)
+    return summary
+
+
+def sign_test(wins, losses): 
+    # two-sided exact sign test (ties dropped): chance of a split at least this uneven if both brains were equal
+    n = wins + losses
+    if(n == 0): 
+        return 1.0
+    tail = sum(math.comb(n, k) for k in range(min(wins, losses) + 1)) / 2**n
+    return min(1.0, 2 * tail)
+
+
+def paired_comparison(scores, reference_scores): 
+    # game by game against the reference brain (same seeds)
+    differences = [score - reference for score, reference in zip(scores, reference_scores)]
+    wins = sum(1 for difference in differences if difference > 0)
+    losses = sum(1 for difference in differences if difference < 0)
+    return {
+        "mean_difference": statistics.mean(differences),
+        "wins": wins,
+        "ties": len(differences) - wins - losses,
+        "losses": losses,
+        "sign_test_p": sign_test(wins, losses)
+    }
+
+
+# --------------------------RUNNING--------------------------
+
+def main(): 
+    parser = argparse.ArgumentParser(description="plays brains against each other on the same seeded games")
+    parser.add_argument("brains", nargs="*", help=f"brain files (default: {BRAINS_GLOB})")
+    parser.add_argument("--games", type=int, default=GAMES_PER_BRAIN, help="games per brain")
+    parser.add_argument("--moves-limit", type=int, default=MOVES_LIMIT, help="moves per game (0 = until game over)")
+    parser.add_argument("--seed", type=int, default=FIRST_SEED, help="seed of the first game")
+    parser.add_argument("--movement-model", choices=MOVEMENT_MODELS, default=MOVEMENT_MODEL, help="how the AI moves pieces (see MoveScanner)")
+    parser.add_argument("--workers", type=int, default=None, help="processes to play games with (default: one per CPU core)")
+    parser.add_argument("--reference", help="brain the others are compared against (default: the first one)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="where to write per-game results and summaries (JSON lines)")
+    args = parser.parse_args()
+    
+    paths = args.brains or sorted(glob.glob(BRAINS_GLOB))
+    if(not paths): 
+        parser.error(f"no brain files found at {BRAINS_GLOB}")
+    names = [brain_name(path) for path in paths]
+    brains = [load_brain(path) for path in paths]
+    
+    reference = args.reference or names[0]
+    if(reference not in names): 
+        parser.error(f"unknown reference brain: {reference} (choose from {', '.join(names)})")
+    
+    seeds = [args.seed + k for k in range(args.games)]
+    moves_limit = args.moves_limit or float('inf')
+    
+    print(f"playing {args.games} games each for {len(brains)} brains ({len(brains) * args.games} games)...")
+    scores = [[None] * len(seeds) for _ in brains]
+    moves = [[None] * len(seeds) for _ in brains]
+    seconds = [[None] * len(seeds) for _ in brains]
+    start_time = time.perf_counter()
+    
+    # per-game results go out as soon as they finish (flushed, so the file can be watched while it runs)
+    with open(args.output, "w") as w: 
+        for i, j, (score, game_moves, game_seconds) in play_tournament(brains, seeds, moves_limit, args.workers, args.movement_model): 
+            scores[i][j] = score
+            moves[i][j] = game_moves
+            seconds[i][j] = game_seconds
+            w.write(json.dumps({"brain": names[i], "seed": seeds[j], "score": score, "moves": game_moves, "seconds": game_seconds}) + "\n")
+            w.flush()
+            print(".", end = "", flush = True)
+        print()
+        
+        summaries = {}
+        reference_scores = scores[names.index(reference)]
+        for name, brain_scores, brain_moves, brain_seconds in zip(names, scores, moves, seconds): 
+            summaries[name] = summarize(brain_scores, brain_moves, brain_seconds)
+            if(name != reference): 
+                summaries[name]["vs_" + reference] = paired_comparison(brain_scores, reference_scores)
+            w.write(json.dumps({"summary": name, **summaries[name]}) + "\n")
+    
+    print(f"{'brain':<16}{'mean':>12}{'median':>12}" + "".join(f"{'p' + str(p):>12}" for p in PERCENTILES) + f"{'pieces/s':>10}")
+    for name, summary in sorted(summaries.items(), key = lambda item: -item[1]["mean"]): 
+        print(f"{name:<16}{summary['mean']:>12,.0f}{summary['median']:>12,.0f}" + "".join(f"{summary['p' + str(p)]:>12,.0f}" for p in PERCENTILES) + f"{summary['pieces_per_second']:>10,.1f}")
+    
+    print(f"\nPaired comparison against {reference} (same seeds):")
+    print(f"{'brain':<16}{'mean diff':>14}{'W-T-L':>12}{'sign test p':>14}")
+    for name, summary in summaries.items(): 
+        if(name == reference): 
+            continue
+        comparison = summary["vs_" + reference]
+        record = f"{comparison['wins']}-{comparison['ties']}-{comparison['losses']}"
+        print(f"{name:<16}{comparison['mean_difference']:>+14,.0f}{record:>12}{comparison['sign_test_p']:>14.3f}")
+    
+    print(f"Saved to {args.output}")
+    print(f"Time Elapsed: {time.perf_counter() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 from tetris_engine import TetrisGame
 from ai_player import GeneticPlayer, generate_random_genome, crossover, mutate
+from profiler import Profiler, NULL_PROFILER
+from vector_env import play_games_lockstep
+from cmaes import CMAES
+from position_dataset import PositionDataset
+from metrics import MetricsSink, NULL_METRICS
+from settings import MOVEMENT_MODEL
 import json
 import random
 import os
 import datetime
+import statistics
+import argparse
+import itertools
+import math
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 # training hyperparameters
@@ -23,13 +35,92 @@ MUTATION_STEP = 2.0
 TRAINING_SAVE_TOGGLE = False
 TRAINING_SAVE_STEP = 5
 
+# fitness (every genome in a generation plays the same GAMES_PER_GENOME piece sequences)
+GAMES_PER_GENOME = 1
+FITNESS_AGGREGATION = "mean" # "mean", "median" or "worst"
+
+# racing (successive halving): every genome plays a short moves budget first, only the best ones play longer budgets
+# budgets are MOVES_LIMIT / RACING_ETA^k (the last rung is the full MOVES_LIMIT), each rung keeps the top 1 / RACING_ETA
+# a rung never keeps fewer genomes than the survivors, and dropped genomes rank below every genome that played the full budget
+# (by the rung they reached), so everything that gets selected played the full budget
+# racing is a heuristic: a genome that starts slow can get dropped even though it would have won at the full budget
+RACING_TOGGLE = False
+RACING_RUNGS = 3
+RACING_ETA = 2
+
+# movement model (see MoveScanner), a cheap model makes move generation a lot faster while the population is still rough
+FAST_MOVEMENT_MODEL = "hard_drop"
+FAST_MOVEMENT_GENERATIONS = 0 # first N generations use FAST_MOVEMENT_MODEL, the rest use MOVEMENT_MODEL (settings.py)
+
+# surrogate pre-screen: genomes first get scored on a recorded position dataset (python position_dataset.py record),
+# by how often they pick the lookahead oracle's move (milliseconds a genome), and only the best SURROGATE_KEEP_RATE play games
+# screened out genomes get (agreement - 2) as their fitness (below any game score, even 0) and rank below every genome that played,
+# and None as their moves, so they're left out of the printed scores and the metrics (they never played a game)
+SURROGATE_TOGGLE = False
+SURROGATE_DATASET_PATH = "positions.tdps"
+SURROGATE_KEEP_RATE = 0.5
+
+# optimizer: "ga" (truncation selection, crossover and mutation, see breed) or "cmaes" (CMA-ES, see cmaes.py)
+# CMA-ES plays CMAES_POPULATION_SIZE genomes a generation (None = 4 + 3 ln(weights), 8 for 5 weights) instead of POPULATION_SIZE,
+# adapts its own step size (starting at CMAES_SIGMA) and restarts with CMAES_RESTART_POPULATION_FACTOR times the genomes once it stalls
+OPTIMIZER = "ga"
+CMAES_SIGMA = 10.0
+CMAES_POPULATION_SIZE = None
+CMAES_RESTART_POPULATION_FACTOR = 2
+CMAES_STAGNATION = 10 # generations without a better generation best before restarting
+
+# island model: ISLAND_COUNT populations of POPULATION_SIZE, each evolving in its own process
+# every ISLAND_MIGRATION_INTERVAL generations each island's best ISLAND_MIGRANTS genomes move to its neighbours
+# ("ring" = the next island, "full" = every other island), replacing the newest children there
+# islands play without profiling, and with RESEED_EACH_GENERATION off an island keeps its seeds only until the next migration
+ISLAND_TOGGLE = False
+ISLAND_COUNT = 4
+ISLAND_MIGRATION_INTERVAL = 5
+ISLAND_MIGRANTS = 2
+ISLAND_TOPOLOGY = "ring" # "ring" or "full"
+
+# game seeds
+# the fitness cache only pays off with RESEED_EACH_GENERATION off: new seeds every generation means carried-over genomes
+# play games they've never played before (the cache then only saves the games racing rungs share within a generation)
+RESEED_EACH_GENERATION = True # False = every generation plays the same seeds (so the fitness cache can skip carried-over genomes)
+FITNESS_CACHE_SIZE = 10000 # max games kept in the fitness cache (and in checkpoints), least recently used go first
+
+# checkpoints (saved after every generation, continue with: python trainer.py --resume)
+CHECKPOINT_TOGGLE = True
+CHECKPOINT_PATH = "training_checkpoint.json"
+
+# profiling (per-phase timers/counters, printed every generation and saved as JSON at the end)
+PROFILING_TOGGLE = False
+PROFILING_OUTPUT_PATH = "profile_output.json"
+
+# metrics (Prometheus textfile rewritten after every genome + JSON lines log, for watching long runs)
+METRICS_TOGGLE = False
+METRICS_PROMETHEUS_PATH = "training_metrics.prom" # point node exporter's textfile collector at this folder
+METRICS_JSONL_PATH = "training_metrics.jsonl" # appended to, so resumed runs keep one log
+
+# lockstep (plays a whole batch of games together, only the scoring is batched with numpy, one batch per worker process)
+# gives the same results as playing them one by one, but doesn't do profiling
+TRAINING_LOCKSTEP_TOGGLE = False
+
+# multiprocessing
+TRAINING_WORKERS = 1 # processes used to play games (1 = no multiprocessing, None = one per CPU core)
+TRAINING_SEED = None # seed for the whole run (same seed = same training output, regardless of TRAINING_WORKERS)
+
 # game playing helper function
-def playGame(weights): 
-    tetris_game = TetrisGame()
-    player = GeneticPlayer(weights)
+def playGame(weights, seed=None, moves_limit=None, profiling=False, movement_model=MOVEMENT_MODEL): 
+    # moves_limit is passed in explicitly since worker processes don't see main() changing MOVES_LIMIT
+    # returns (score, moves, profile snapshot (None when profiling is off))
+    if moves_limit is None: 
+        moves_limit = MOVES_LIMIT
+    
+    profiler = Profiler() if profiling else NULL_PROFILER
+    game_start = profiler.start()
+        
+    tetris_game = TetrisGame(seed)
+    player = GeneticPlayer(weights, profiler=profiler, movement_model=movement_model)
     
     moves = 0
-    while not tetris_game.game_over and moves < MOVES_LIMIT: 
+    while not tetris_game.game_over and moves < moves_limit: 
         # get best move based on the player
         current_move, swap_hold = player.get_best_move(tetris_game)
         
@@ -37,102 +128,419 @@ def playGame(weights):
             break # AI gave up
         
         # make the move
+        start = profiler.start()
         tetris_game.step(current_move, swap_hold)
+        profiler.stop("step", start)
         
         moves += 1
     
-    return (tetris_game.score, moves)
+    profiler.stop("game", game_start)
+    profiler.count("pieces", moves)
     
+    return (tetris_game.score, moves, profiler.snapshot())
 
-def main(): 
-    global MOVES_LIMIT
+
+def evaluate_population(population, game_seeds, moves_limit, pool=None, tasks=None, movement_model=MOVEMENT_MODEL, profiling=None): 
+    # plays every genome on every seed (or just the (genome index, seed index) pairs in tasks)
+    # yields (genome index, seed index, (score, moves)) as soon as each game finishes
+    if tasks is None: 
+        tasks = [(i, j) for i in range(len(population)) for j in range(len(game_seeds))]
+    if profiling is None: 
+        profiling = PROFILING_TOGGLE
     
-    start_time = datetime.datetime.now() 
+    if TRAINING_LOCKSTEP_TOGGLE: 
+        yield from evaluate_lockstep(population, game_seeds, moves_limit, tasks, pool, movement_model)
+        return
     
-    print("generating population...")
-    population = [generate_random_genome() for _ in range(POPULATION_SIZE)]
+    if pool is None: 
+        for i, j in tasks: 
+            yield i, j, playGame(population[i], game_seeds[j], moves_limit, profiling, movement_model)
+        return
     
-    # best player stats
-    best_player_weights = None
-    best_player_moves = -1
-    best_player_score = -1
+    futures = {pool.submit(playGame, population[i], game_seeds[j], moves_limit, profiling, movement_model): (i, j) for i, j in tasks}
+    for future in as_completed(futures): 
+        i, j = futures[future]
+        yield i, j, future.result()
+
+
+def evaluate_lockstep(population, game_seeds, moves_limit, tasks, pool=None, movement_model=MOVEMENT_MODEL): 
+    # splits the games into one lockstep batch per worker (or one batch if there's no pool)
+    chunk_count = 1 if pool is None else (TRAINING_WORKERS or os.cpu_count())
+    chunks = [tasks[k::chunk_count] for k in range(chunk_count)]
+    chunks = [chunk for chunk in chunks if chunk]
     
-    for generation in range(GENERATIONS): 
-        print(f"<------Generation {generation + 1} out of {GENERATIONS}------>")
+    def chunk_args(chunk): 
+        return [population[i] for i, j in chunk], [game_seeds[j] for i, j in chunk], moves_limit, movement_model
+    
+    if pool is None: 
+        for chunk in chunks: 
+            for (i, j), (score, moves) in zip(chunk, play_games_lockstep(*chunk_args(chunk))): 
+                yield i, j, (score, moves, None)
+        return
+    
+    futures = {pool.submit(play_games_lockstep, *chunk_args(chunk)): chunk for chunk in chunks}
+    for future in as_completed(futures): 
+        for (i, j), (score, moves) in zip(futures[future], future.result()): 
+            yield i, j, (score, moves, None)
+
+
+class FitnessCache: 
+    # per-game results keyed by (genome, seed, movement model, moves limit), so carried-over genomes don't replay games
+    # a game that ended before its moves limit (game over) is also good for any bigger limit
+    # bounded LRU (like MoveCache), and games on seeds that won't come up again get dropped by keep_seeds()
+    def __init__(self, max_entries=FITNESS_CACHE_SIZE): 
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # (genome key, seed, movement model) -> (moves limit, score, moves)
+        self.hits = 0
         
-        max_moves_hit = False
+    def _key(self, genome, seed, movement_model): 
+        return (tuple(sorted(genome.items())), seed, movement_model)
+    
+    def get(self, genome, seed, movement_model, moves_limit): 
+        key = self._key(genome, seed, movement_model)
+        entry = self.entries.get(key)
+        if(entry is None): 
+            return None
         
-        population_results = []
-        print("Training Started: ")
-        for i, genome in enumerate(population): 
-            player_results = playGame(genome)
+        cached_limit, score, moves = entry
+        if(cached_limit == moves_limit or (moves < cached_limit and moves < moves_limit)): 
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return (score, moves, None)
+        return None
+    
+    def put(self, genome, seed, movement_model, moves_limit, result): 
+        key = self._key(genome, seed, movement_model)
+        self.entries[key] = (moves_limit, result[0], result[1])
+        self.entries.move_to_end(key)
+        
+        # kick out the least recently used game once it's over the limit
+        if(len(self.entries) > self.max_entries): 
+            self.entries.popitem(last=False)
+    
+    def keep_seeds(self, seeds): 
+        # drops every game that wasn't played on one of these seeds (they can't be hit again once the seeds change)
+        seeds = set(seeds)
+        for key in [key for key in self.entries if key[1] not in seeds]: 
+            del self.entries[key]
+        
+    def to_json(self): 
+        return [[dict(genome), seed, movement_model, entry[0], entry[1], entry[2]] for (genome, seed, movement_model), entry in self.entries.items()]
+    
+    def load_json(self, data): 
+        for entry in data: 
+            if(len(entry) == 5): 
+                # checkpoints from before movement models were added: every game was played with the full SRS search
+                genome, seed, moves_limit, score, moves = entry
+                movement_model = "srs"
+            else: 
+                genome, seed, movement_model, moves_limit, score, moves = entry
+            self.put(genome, seed, movement_model, moves_limit, (score, moves))
+
+
+def save_checkpoint(path, state): 
+    # write to a temp file first so a crash mid-write can't wreck the last good checkpoint
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as w: 
+        json.dump(state, w)
+    os.replace(temp_path, path)
+
+
+def rng_state_to_json(state): 
+    version, internal_state, gauss_next = state
+    return [version, list(internal_state), gauss_next]
+
+
+def rng_state_from_json(state): 
+    version, internal_state, gauss_next = state
+    return (version, tuple(internal_state), gauss_next)
+
+
+def racing_budgets(moves_limit): 
+    # moves limit for every rung, shortest first
+    budgets = [max(1, moves_limit // RACING_ETA**(RACING_RUNGS - 1 - rung)) for rung in range(RACING_RUNGS)]
+    return sorted(set(budgets))
+
+
+def score_population(population, game_seeds, moves_limit, movement_model, pool=None, fitness_cache=None, profiler=NULL_PROFILER, profile_games=None, log=print, surrogate=None, metrics=NULL_METRICS, selection_count=None): 
+    # plays every genome on every seed (racing them if RACING_TOGGLE is on, skipping games that are in the fitness cache)
+    # with a surrogate (PositionDataset) only the genomes that pass its screen play at all
+    # returns ([(fitness score, genome, moves) per genome, ranked best first], did a game hit the moves limit?)
+    # genomes without a full budget score (dropped by racing or screened out) have None as their moves and rank below
+    # every genome that has one, further down the earlier they stopped
+    # games only get profiled when there's a profile_games list to log them in (islands play without profiling)
+    # selection_count = genomes the optimizer selects from (default: the GA's survivors), racing and the surrogate never keep fewer
+    if fitness_cache is None: 
+        fitness_cache = FitnessCache(FITNESS_CACHE_SIZE)
+    
+    population_results = [None] * len(population)
+    max_moves_hit = False
+    rungs = racing_budgets(moves_limit) if RACING_TOGGLE else [moves_limit]
+    survivor_count = selection_count if selection_count is not None else int(SURVIVAL_RATE * len(population))
+    racers = list(range(len(population)))
+    if(surrogate is not None): 
+        start = metrics.start()
+        racers = surrogate_screen(population, population_results, surrogate, survivor_count, log)
+        metrics.stop("surrogate", start)
+    screened_out = len(population) - len(racers)
+    rungs_finished = [0] * len(population)
+    pieces_played = [0] * len(population) # over every rung, for the metrics
+    cache_hits = 0
+    games_start = metrics.start()
+    for rung, rung_limit in enumerate(rungs): 
+        if(rung > 0): 
+            # ranked on the short budget's scores, a heuristic (see RACING_TOGGLE)
+            keep = max(survivor_count, -(-len(racers) // RACING_ETA))
+            ranked = sorted(racers, key = lambda i: population_results[i][0], reverse = True)
+            racers = ranked[:keep]
+            
+            # dropped genomes are done, so this is their last (and only) metrics update, kept out of the score gauges
+            for i in ranked[keep:]: 
+                score, genome, moves = population_results[i]
+                metrics.genome_scored(i, score, moves, pieces_played[i], rung - 1, full_budget=False)
+        
+        if(len(rungs) > 1): 
+            log(f"Rung {rung + 1}/{len(rungs)}: {len(racers)} genomes, {rung_limit} moves ", end = "", flush = True)
+        
+        # games already played with the same genome, seed and moves limit come from the cache
+        cached_results = []
+        tasks = []
+        for i in racers: 
+            for j, seed in enumerate(game_seeds): 
+                result = fitness_cache.get(population[i], seed, movement_model, rung_limit)
+                if(result is not None): 
+                    cached_results.append((i, j, result))
+                else: 
+                    tasks.append((i, j))
+        cache_hits += len(cached_results)
+        
+        # slot results by index (not finishing order) so sorting ties stay deterministic
+        game_results = [[None] * len(game_seeds) for _ in population]
+        games_left = [len(game_seeds)] * len(population)
+        played_results = evaluate_population(population, game_seeds, rung_limit, pool, tasks, movement_model, PROFILING_TOGGLE and profile_games is not None)
+        for k, (i, j, player_results) in enumerate(itertools.chain(cached_results, played_results)): 
+            game_results[i][j] = player_results
+            if(k >= len(cached_results)): 
+                pieces_played[i] += player_results[1]
+            fitness_cache.put(population[i], game_seeds[j], movement_model, rung_limit, player_results)
             
-            player_score = player_results[0]
-            player_moves = player_results[1]
+            if(player_results[2] is not None): 
+                profiler.merge(player_results[2])
+                profile_games.append({"genome": i, "seed": game_seeds[j], "moves_limit": rung_limit, "score": player_results[0], "moves": player_results[1], "profile": player_results[2]})
             
-            if(player_moves >= MOVES_LIMIT and MOVES_LIMIT_SHIFTING_TOGGLE and not max_moves_hit): 
+            if(player_results[1] >= moves_limit and MOVES_LIMIT_SHIFTING_TOGGLE and not max_moves_hit): 
                 # print("A player hit the moves limit! Increasing moves limit next generation...")
                 max_moves_hit = True
             
-            population_results.append((player_score, genome, player_moves))
+            games_left[i] -= 1
+            if(games_left[i] > 0): 
+                continue
+            
+            player_score = aggregate_fitness([result[0] for result in game_results[i]], FITNESS_AGGREGATION)
+            player_moves = aggregate_fitness([result[1] for result in game_results[i]], FITNESS_AGGREGATION)
+            
+            population_results[i] = (player_score, population[i], player_moves)
+            rungs_finished[i] = rung + 1
+            if(rung == len(rungs) - 1): 
+                metrics.genome_scored(i, player_score, player_moves, pieces_played[i], rung)
             
             # show training progress
-            print(".", end = "", flush = True)
+            log(".", end = "", flush = True)
         
-        print()
+        log()
+    metrics.stop("games", games_start)
+    
+    if(cache_hits): 
+        log(f"Games reused from the fitness cache: {cache_hits}")
+    if(len(rungs) > 1): 
+        log(f"Genomes stopped early by racing: {len(population) - screened_out - len(racers)}")
+    
+    # dropped genomes only have a short budget score, that's not a fitness to compare with (or report next to) full ones
+    for i in range(len(population)): 
+        if(0 < rungs_finished[i] < len(rungs)): 
+            population_results[i] = (population_results[i][0], population[i], None)
+    
+    # sorted on (rungs finished, score), ties keep population order
+    order = sorted(range(len(population)), key = lambda i: (rungs_finished[i], population_results[i][0]), reverse = True)
+    return [population_results[i] for i in order], max_moves_hit
+
+
+def surrogate_screen(population, population_results, surrogate, survivor_count, log=print): 
+    # returns the genome indexes that go on to play games, screened out genomes get their population_results filled in
+    # (ranked by agreement, below every genome that plays, with moves None since they never played)
+    agreement = surrogate.agreement(population)
+    keep = min(len(population), max(survivor_count, 1, math.ceil(SURROGATE_KEEP_RATE * len(population))))
+    passed = sorted(sorted(range(len(population)), key = lambda i: agreement[i], reverse = True)[:keep])
+    
+    for i in set(range(len(population))) - set(passed): 
+        population_results[i] = (agreement[i] - 2, population[i], None)
+    
+    log(f"Surrogate screen: {len(population) - keep} genomes screened out (oracle agreement {min(agreement):.1%} to {max(agreement):.1%})")
+    return passed
+
+
+def breed(population_results, population_size): 
+    # truncation selection: the best SURVIVAL_RATE carry over, the rest are mutated children of two random survivors
+    # population_results has to be sorted best first
+    cutoff = int(SURVIVAL_RATE * POPULATION_SIZE)
+    survivors = [genome[1] for genome in population_results[:cutoff]]
+    
+    # build the next generation of players
+    next_generation = survivors[:] # start with survivors
+    
+    # breeding
+    while len(next_generation) < population_size: 
+        # choose two random parents from the list of survivors
+        parent1 = random.choice(survivors)
+        parent2 = random.choice(survivors)
         
-        # sort scores by highest to lowest
-        population_results.sort(key = lambda x: x[0], reverse = True)
+        # make and mutate the child
+        child = mutate(crossover(parent1, parent2), MUTATION_RATE, MUTATION_STEP)
         
-        # output data for best
-        print(f"Generation Best Score: {population_results[0][0]}")
-        print(f"Weights: {population_results[0][1]}")
-        print(f"Moves: {population_results[0][2]}")
-        
-        # output scores for everything
-        just_scores = [round(x[0], 2) for x in population_results]
-        print(f"All Population Scores: {just_scores}")
+        next_generation.append(child)
+    
+    return next_generation
+
+
+class GeneticOptimizer: 
+    # the original GA behind the same ask/tell interface as CMAES
+    def __init__(self, population_size): 
+        self.population = [generate_random_genome() for _ in range(population_size)]
+        self.selection_count = int(SURVIVAL_RATE * POPULATION_SIZE) # survivors breed picks (see breed)
+    
+    def ask(self): 
+        return self.population
+    
+    def tell(self, population_results): 
+        # death, survivors and breeding -> replace the population with the next generation
+        self.population = breed(population_results, len(self.population))
+        return None
+    
+    def to_json(self): 
+        return {"population": self.population}
+    
+    def load_json(self, data): 
+        self.population = data["population"]
+
+
+def make_optimizer(): 
+    # every optimizer has ask() -> genomes to play, tell(population_results sorted best first) -> restart reason or None,
+    # selection_count (how many of the best tell() actually uses) and to_json()/load_json() for checkpoints
+    if OPTIMIZER == "ga": 
+        return GeneticOptimizer(POPULATION_SIZE)
+    if OPTIMIZER == "cmaes": 
+        return CMAES(generate_random_genome, CMAES_SIGMA, CMAES_POPULATION_SIZE, CMAES_RESTART_POPULATION_FACTOR, CMAES_STAGNATION)
+    raise ValueError(f"unknown optimizer: {OPTIMIZER}")
+
+
+def movement_model_for(generation): 
+    return FAST_MOVEMENT_MODEL if generation < FAST_MOVEMENT_GENERATIONS else MOVEMENT_MODEL
+
+
+def aggregate_fitness(values, method): 
+    # combines one genome's per-game results into one number
+    if method == "mean": 
+        return statistics.mean(values)
+    if method == "median": 
+        return statistics.median(values)
+    if method == "worst": 
+        return min(values)
+    raise ValueError(f"unknown fitness aggregation: {method}")
+    
+
+def evolve_island(population, start_generation, generations, moves_limit, seed): 
+    # runs a few generations of one island (in a worker process, games played one by one)
+    # returns (population after breeding, best (score, genome, moves) seen, moves limit, best score of each generation)
+    random.seed(seed)
+    best_player = (-1, None, -1)
+    generation_bests = []
+    fitness_cache = FitnessCache(FITNESS_CACHE_SIZE)
+    surrogate = PositionDataset(SURROGATE_DATASET_PATH) if SURROGATE_TOGGLE else None
+    run_seeds = None
+    if(not RESEED_EACH_GENERATION): 
+        run_seeds = [random.randrange(2**32) for _ in range(GAMES_PER_GENOME)]
+    
+    for generation in range(start_generation, start_generation + generations): 
+        game_seeds = run_seeds or [random.randrange(2**32) for _ in range(GAMES_PER_GENOME)]
+        fitness_cache.keep_seeds(game_seeds)
+        population_results, max_moves_hit = score_population(population, game_seeds, moves_limit, movement_model_for(generation), 
+                                                             fitness_cache=fitness_cache, log=lambda *args, **kwargs: None, surrogate=surrogate)
         
-        # see if there's a new best player
-        if population_results[0][0] > best_player_score: 
-            print(f"NEW TRAINING SESSION BEST PLAYER!!!!!!")
-            best_player_score = population_results[0][0]
-            best_player_weights = population_results[0][1]
-            best_player_moves = population_results[0][2]
-            
-        # max moves hit by a player -> extra moves being added (if toggled on)
-        if(max_moves_hit and MOVES_LIMIT_SHIFTING_TOGGLE and MOVES_LIMIT < MOVES_LIMIT_SHIFTING_CAP): 
-            print(f"MAX MOVES HIT! Increasing the moves limit by {MOVES_LIMIT_SHIFT_STEP}")
-            MOVES_LIMIT += MOVES_LIMIT_SHIFT_STEP
+        generation_bests.append(population_results[0][0])
+        if population_results[0][0] > best_player[0]: 
+            best_player = population_results[0]
         
-        # death and survivors
-        cutoff = int(SURVIVAL_RATE * POPULATION_SIZE)
-        survivors = [genome[1] for genome in population_results[:cutoff]]
+        if(max_moves_hit and MOVES_LIMIT_SHIFTING_TOGGLE and moves_limit < MOVES_LIMIT_SHIFTING_CAP): 
+            moves_limit += MOVES_LIMIT_SHIFT_STEP
         
-        # build the next generation of players
-        next_generation = survivors[:] # start with survivors
+        population = breed(population_results, len(population))
+    
+    if surrogate is not None: 
+        surrogate.close()
+    return population, best_player, moves_limit, generation_bests
+
+
+def migrate(islands): 
+    # every island's best genomes (survivors sit at the front after breeding) replace the newest children of its neighbours
+    # the receiving island's own survivors are never overwritten
+    if ISLAND_TOPOLOGY not in ("ring", "full"): 
+        raise ValueError(f"unknown island topology: {ISLAND_TOPOLOGY}")
+    
+    migrants = [population[:ISLAND_MIGRANTS] for population in islands]
+    room = POPULATION_SIZE - int(SURVIVAL_RATE * POPULATION_SIZE)
+    for k, population in enumerate(islands): 
+        if(ISLAND_TOPOLOGY == "ring"): 
+            sources = [(k - 1) % len(islands)]
+        else: 
+            sources = [other for other in range(len(islands)) if other != k]
         
-        # breeding
-        while len(next_generation) < len(population): 
-            # choose two random parents from the list of survivors
-            parent1 = random.choice(survivors)
-            parent2 = random.choice(survivors)
+        arrivals = [dict(genome) for source in sources if source != k for genome in migrants[source]][:room]
+        if(arrivals): 
+            population[-len(arrivals):] = arrivals
+
+
+def run_islands(): 
+    # island mode of main(), returns the best (score, genome, moves) over every island
+    print(f"generating {ISLAND_COUNT} island populations...")
+    islands = [[generate_random_genome() for _ in range(POPULATION_SIZE)] for _ in range(ISLAND_COUNT)]
+    moves_limits = [MOVES_LIMIT] * ISLAND_COUNT
+    best_player = (-1, None, -1)
+    
+    # one process per island, they only sync up to migrate
+    with ProcessPoolExecutor(max_workers=ISLAND_COUNT) as pool: 
+        generation = 0
+        while generation < GENERATIONS: 
+            generations = min(ISLAND_MIGRATION_INTERVAL, GENERATIONS - generation)
+            span = f"Generation {generation + 1}" if generations == 1 else f"Generations {generation + 1}-{generation + generations}"
+            print(f"<------{span} out of {GENERATIONS}------>")
             
-            # make and mutate the child
-            child = mutate(crossover(parent1, parent2), MUTATION_RATE, MUTATION_STEP)
+            # island seeds come from the trainer's RNG, so TRAINING_SEED still makes the whole run repeatable
+            island_seeds = [random.randrange(2**32) for _ in islands]
+            futures = [pool.submit(evolve_island, islands[k], generation, generations, moves_limits[k], island_seeds[k]) for k in range(ISLAND_COUNT)]
             
-            next_generation.append(child)
-        
-        # replace the population with the next generation
-        population = next_generation[:]
-        
-        if(TRAINING_SAVE_TOGGLE and (generation + 1) % TRAINING_SAVE_STEP == 0): 
-            with open(f'brains/latest_brain_gen{generation + 1}.json', 'w') as w: 
-                json.dump((best_player_score, best_player_weights), w)
-            print(f"Saved to brains/latest_brain_gen{generation + 1}.json")
-    
-    print(f"Training Finished.")
+            for k, future in enumerate(futures): 
+                islands[k], island_best, moves_limits[k], generation_bests = future.result()
+                print(f"Island {k + 1}: generation bests {generation_bests}, moves limit {moves_limits[k]}")
+                
+                if island_best[0] > best_player[0]: 
+                    print(f"NEW TRAINING SESSION BEST PLAYER!!!!!! (island {k + 1}, score {island_best[0]})")
+                    best_player = island_best
+            
+            generation += generations
+            if(generation < GENERATIONS and ISLAND_COUNT > 1): 
+                migrate(islands)
+                print(f"Migrated the top {ISLAND_MIGRANTS} of every island ({ISLAND_TOPOLOGY} topology)")
+            
+            if(TRAINING_SAVE_TOGGLE and generation % TRAINING_SAVE_STEP < generations): 
+                with open(f'brains/latest_brain_gen{generation}.json', 'w') as w: 
+                    json.dump((best_player[0], best_player[1]), w)
+                print(f"Saved to brains/latest_brain_gen{generation}.json")
     
+    print(f"Best Weights: {best_player[1]}")
+    return best_player
+
+
+def save_best_brain(best_player_score, best_player_weights, best_player_moves): 
     # fitness calculation (probably useless lmao I was just playing around)
     best_player_fitness = best_player_score * (1 + best_player_score/best_player_moves)
     
@@ -155,7 +563,187 @@ def main():
         with open('brains/best_brain.json', 'w') as w: 
             json.dump((best_player_score, best_player_weights), w)
         print("Saved to brains/best_brain.json")
+
+
+def main(): 
+    global MOVES_LIMIT
+    
+    parser = argparse.ArgumentParser(description="trains a genetic Tetris AI")
+    parser.add_argument("--resume", nargs="?", const=CHECKPOINT_PATH, metavar="CHECKPOINT", help=f"continue a run from its checkpoint (default: {CHECKPOINT_PATH})")
+    args = parser.parse_args()
+    
+    start_time = datetime.datetime.now() 
+    
+    if TRAINING_SEED is not None: 
+        random.seed(TRAINING_SEED)
+    
+    if(ISLAND_TOGGLE): 
+        if(args.resume): 
+            parser.error("--resume doesn't work in island mode (islands don't write checkpoints)")
+        if(OPTIMIZER != "ga"): 
+            parser.error("island mode only works with the GA optimizer (OPTIMIZER = \"ga\")")
+        if(PROFILING_TOGGLE): 
+            print("islands play without profiling (PROFILING_TOGGLE is ignored in island mode)")
+        save_best_brain(*run_islands())
+        print(f"Training Time Elapsed: {datetime.datetime.now() - start_time}")
+        return
+    
+    pool = None
+    if TRAINING_WORKERS is None or TRAINING_WORKERS > 1: 
+        pool = ProcessPoolExecutor(max_workers=TRAINING_WORKERS)
+        print(f"playing games with {TRAINING_WORKERS or os.cpu_count()} processes...")
+    
+    # profiling roll-ups (games -> generation -> whole run)
+    run_profiler = Profiler() if PROFILING_TOGGLE else NULL_PROFILER
+    profile_log = []
+    
+    fitness_cache = FitnessCache(FITNESS_CACHE_SIZE)
+    
+    metrics = NULL_METRICS
+    if(METRICS_TOGGLE): 
+        metrics = MetricsSink(METRICS_PROMETHEUS_PATH, METRICS_JSONL_PATH)
+        print(f"writing metrics to {METRICS_PROMETHEUS_PATH} and {METRICS_JSONL_PATH}")
+    
+    surrogate = None
+    if(SURROGATE_TOGGLE): 
+        surrogate = PositionDataset(SURROGATE_DATASET_PATH)
+        print(f"screening genomes on {len(surrogate)} positions from {SURROGATE_DATASET_PATH}...")
+    
+    if(args.resume): 
+        print(f"resuming from {args.resume}...")
+        with open(args.resume, "r") as r: 
+            checkpoint = json.load(r)
+        
+        if("optimizer" not in checkpoint): 
+            # checkpoints from before optimizers were selectable only have the GA's population
+            checkpoint["optimizer"] = "ga"
+            checkpoint["optimizer_state"] = {"population": checkpoint["population"]}
+        if(checkpoint["optimizer"] != OPTIMIZER): 
+            parser.error(f"{args.resume} was made with the {checkpoint['optimizer']} optimizer, OPTIMIZER is {OPTIMIZER}")
         
+        start_generation = checkpoint["generation"]
+        optimizer = make_optimizer()
+        optimizer.load_json(checkpoint["optimizer_state"])
+        MOVES_LIMIT = checkpoint["moves_limit"]
+        best_player_score, best_player_weights, best_player_moves = checkpoint["best_player"]
+        run_seeds = checkpoint["run_seeds"]
+        fitness_cache.load_json(checkpoint["fitness_cache"])
+        random.setstate(rng_state_from_json(checkpoint["rng_state"]))
+    else: 
+        print("generating population...")
+        start_generation = 0
+        optimizer = make_optimizer()
+        
+        # best player stats
+        best_player_weights = None
+        best_player_moves = -1
+        best_player_score = -1
+        
+        # seeds for the whole run (only used when RESEED_EACH_GENERATION is off)
+        run_seeds = None
+        if(not RESEED_EACH_GENERATION): 
+            run_seeds = [random.randrange(2**32) for _ in range(GAMES_PER_GENOME)]
+    
+    for generation in range(start_generation, GENERATIONS): 
+        print(f"<------Generation {generation + 1} out of {GENERATIONS}------>")
+        population = optimizer.ask()
+        
+        # the whole generation plays the same seeds (common random numbers), so genomes are compared on the same pieces
+        # seeds come from the trainer's RNG so results don't depend on which process plays them
+        if(run_seeds is not None): 
+            game_seeds = run_seeds
+        else: 
+            game_seeds = [random.randrange(2**32) for _ in range(GAMES_PER_GENOME)]
+        fitness_cache.keep_seeds(game_seeds)
+        
+        generation_profiler = Profiler() if PROFILING_TOGGLE else NULL_PROFILER
+        generation_games = []
+        
+        movement_model = movement_model_for(generation)
+        if(generation == FAST_MOVEMENT_GENERATIONS and generation > 0): 
+            print(f"Switching from the {FAST_MOVEMENT_MODEL} movement model to {MOVEMENT_MODEL}")
+        
+        print("Training Started: ")
+        metrics.start_generation(generation, MOVES_LIMIT)
+        population_results, max_moves_hit = score_population(population, game_seeds, MOVES_LIMIT, movement_model, pool, fitness_cache, generation_profiler, generation_games, 
+                                                             surrogate=surrogate, metrics=metrics, selection_count=optimizer.selection_count)
+        
+        if(generation_profiler.enabled): 
+            print(generation_profiler.summary_table())
+            run_profiler.merge(generation_profiler.snapshot())
+            generation_games.sort(key = lambda game: (game["genome"], game["seed"], game["moves_limit"]))
+            profile_log.append({"generation": generation + 1, "moves_limit": MOVES_LIMIT, "totals": generation_profiler.snapshot(), "games": generation_games})
+        
+        # output data for best
+        print(f"Generation Best Score: {population_results[0][0]}")
+        print(f"Weights: {population_results[0][1]}")
+        print(f"Moves: {population_results[0][2]}")
+        
+        # output scores for everything that played the full budget (screened out and raced out genomes don't have a real score)
+        just_scores = [round(x[0], 2) for x in population_results if x[2] is not None]
+        print(f"All Population Scores: {just_scores}")
+        if(len(just_scores) < len(population_results)): 
+            print(f"Left Out: {len(population_results) - len(just_scores)} genomes (screened out or stopped early by racing)")
+        
+        # see if there's a new best player
+        if population_results[0][0] > best_player_score: 
+            print(f"NEW TRAINING SESSION BEST PLAYER!!!!!!")
+            best_player_score = population_results[0][0]
+            best_player_weights = population_results[0][1]
+            best_player_moves = population_results[0][2]
+            
+        # max moves hit by a player -> extra moves being added (if toggled on)
+        if(max_moves_hit and MOVES_LIMIT_SHIFTING_TOGGLE and MOVES_LIMIT < MOVES_LIMIT_SHIFTING_CAP): 
+            print(f"MAX MOVES HIT! Increasing the moves limit by {MOVES_LIMIT_SHIFT_STEP}")
+            metrics.moves_limit_changed(MOVES_LIMIT, MOVES_LIMIT + MOVES_LIMIT_SHIFT_STEP)
+            MOVES_LIMIT += MOVES_LIMIT_SHIFT_STEP
+        
+        # next generation (GA: survivors and children, CMA-ES: new samples around the updated mean)
+        start = metrics.start()
+        restart_reason = optimizer.tell(population_results)
+        metrics.stop("breeding", start)
+        if(restart_reason): 
+            print(f"Restarting CMA-ES ({restart_reason}) with {optimizer.population_size} genomes per generation")
+        
+        if(TRAINING_SAVE_TOGGLE and (generation + 1) % TRAINING_SAVE_STEP == 0): 
+            with open(f'brains/latest_brain_gen{generation + 1}.json', 'w') as w: 
+                json.dump((best_player_score, best_player_weights), w)
+            print(f"Saved to brains/latest_brain_gen{generation + 1}.json")
+        
+        if(CHECKPOINT_TOGGLE): 
+            # everything needed to carry on from the next generation exactly like this run would have
+            start = metrics.start()
+            save_checkpoint(CHECKPOINT_PATH, {
+                "generation": generation + 1, 
+                "optimizer": OPTIMIZER, 
+                "optimizer_state": optimizer.to_json(), 
+                "moves_limit": MOVES_LIMIT, 
+                "best_player": [best_player_score, best_player_weights, best_player_moves], 
+                "run_seeds": run_seeds, 
+                "fitness_cache": fitness_cache.to_json(), 
+                "rng_state": rng_state_to_json(random.getstate())
+            })
+            metrics.stop("checkpoint", start)
+        
+        metrics.end_generation([x[0] for x in population_results if x[2] is not None], best_player_score)
+    
+    if pool is not None: 
+        pool.shutdown()
+    if surrogate is not None: 
+        surrogate.close()
+    metrics.close()
+    
+    print(f"Training Finished.")
+    
+    if(run_profiler.enabled): 
+        print("Whole run:")
+        print(run_profiler.summary_table())
+        with open(PROFILING_OUTPUT_PATH, 'w') as w: 
+            json.dump({"totals": run_profiler.snapshot(), "generations": profile_log}, w)
+        print(f"Saved profile to {PROFILING_OUTPUT_PATH}")
+    
+    save_best_brain(best_player_score, best_player_weights, best_player_moves)
+    
     print(f"Training Time Elapsed: {datetime.datetime.now() - start_time}")
     
         
@@ -0,0 +1,101 @@
+from tetris_engine import TetrisGame, MoveScanner
+from ai_player import GeneticPlayer, BatchBoardEvaluator, np
+from settings import MOVEMENT_MODEL
+
+# Lockstep multi-game environment (batched scoring across games)
+# N games move forward together: every active game's candidates get scored in one numpy batch,
+# then every chosen move is applied in one step() call
+# only the scoring is batched: the games keep their own bitboards (for the engine rules) and move generation
+# runs per game (GeneticPlayer.get_candidate_moves), every turn their row masks get stacked into one
+# (games, height) array just for the batch (see BatchBoardEvaluator.build_multi_stack)
+
+
+class VectorTetrisEnv: 
+    def __init__(self, seeds, moves_limit=None): 
+        self.games = [TetrisGame(seed) for seed in seeds]
+        self.moves = [0] * len(self.games)
+        self.moves_limit = moves_limit # None = play until game over
+        self.done = [game.game_over or moves_limit == 0 for game in self.games]
+    
+    def active_indices(self): 
+        return [i for i, done in enumerate(self.done) if not done]
+    
+    def all_done(self): 
+        return all(self.done)
+    
+    def step(self, chosen_moves): 
+        # chosen_moves[i] = (move, swap_hold) for game i (ignored for finished games)
+        # a None move means the AI had nothing to play, which ends that game (same as playGame)
+        for i, (move, swap_hold) in enumerate(chosen_moves): 
+            if(self.done[i]): 
+                continue
+            
+            if(not move): 
+                self.done[i] = True
+                continue
+            
+            game = self.games[i]
+            game.step(move, swap_hold)
+            self.moves[i] += 1
+            
+            if(game.game_over or (self.moves_limit is not None and self.moves[i] >= self.moves_limit)): 
+                self.done[i] = True
+    
+    def results(self): 
+        return [(game.score, moves) for game, moves in zip(self.games, self.moves)]
+
+
+
+class VectorGeneticPlayer: 
+    # picks moves for every game in a VectorTetrisEnv at once (greedy, current + held piece like GeneticPlayer)
+    def __init__(self, weights_list, movement_model=MOVEMENT_MODEL): 
+        self.weights_list = weights_list
+        self.scanner = MoveScanner(movement_model=movement_model) # shared, so the move cache works across games
+        self.batch_evaluator = BatchBoardEvaluator() if np is not None else None
+        
+        # one-at-a-time players for games the batch can't handle (or when numpy isn't installed)
+        self.players = [GeneticPlayer(weights) for weights in weights_list]
+        for player in self.players: 
+            player.scanner = self.scanner
+    
+    def get_best_moves(self, env): 
+        # returns [(move, swap_hold), ...] for every game (None moves for finished ones)
+        chosen_moves = [(None, False)] * len(env.games)
+        
+        batch_games = []
+        batch_moves = []
+        batch_splits = []
+        for i in env.active_indices(): 
+            game = env.games[i]
+            moves, extra_moves = self.players[i].get_candidate_moves(game)
+            
+            if(self.batch_evaluator is None or not self.players[i]._can_batch(moves, extra_moves)): 
+                chosen_moves[i] = self.players[i]._pick_best(game, moves, extra_moves)
+                continue
+            
+            batch_games.append(i)
+            batch_moves.append(moves + extra_moves)
+            batch_splits.append(len(moves))
+        
+        if(batch_games): 
+            boards = [env.games[i].board for i in batch_games]
+            weights_list = [self.weights_list[i] for i in batch_games]
+            all_scores = self.batch_evaluator.get_scores_multi(boards, batch_moves, weights_list)
+            
+            for i, candidates, split, scores in zip(batch_games, batch_moves, batch_splits, all_scores): 
+                best_index = int(np.argmax(scores)) # first one wins ties, same as GeneticPlayer
+                chosen_moves[i] = (candidates[best_index], best_index >= split)
+        
+        return chosen_moves
+
+
+def play_games_lockstep(weights_list, seeds, moves_limit=None, movement_model=MOVEMENT_MODEL): 
+    # plays game i with weights_list[i] on seeds[i], all in lockstep
+    # returns [(score, moves), ...] in the same order (same results as playing them one by one)
+    env = VectorTetrisEnv(seeds, moves_limit)
+    player = VectorGeneticPlayer(weights_list, movement_model)
+    
+    while(not env.all_done()): 
+        env.step(player.get_best_moves(env))
+    
+    return env.results()